@@ -0,0 +1,162 @@
+"""
+archive.py
+
+ZIP support for SnapBack. A .zip file can be used as the input: its image
+members are listed and decoded straight from the archive, without
+extracting anything to disk. A member is addressed by a virtual path, the
+archive path followed by the member name ("shots.zip/day1/a.png").
+
+Outputs can be streamed into a .zip as well (ZipSink), instead of being
+written as thousands of separate files.
+"""
+
+import io
+import os
+import threading
+import zipfile
+from discovery import IMAGE_EXTENSIONS, parse_patterns, matches_patterns
+
+# zip path -> (mtime_ns, ZipFile), kept open for repeated member reads.
+_open_archives = {}
+_archives_lock = threading.Lock()
+
+def is_zip_name(path):
+    return bool(path) and path.lower().endswith(".zip")
+
+def is_archive(path):
+    """
+    True if path is an existing .zip file.
+    """
+    return is_zip_name(path) and os.path.isfile(path)
+
+def member_path(zip_path, name):
+    return f"{zip_path}/{name}"
+
+def split_member(path):
+    """
+    (zip path, member name) for a virtual member path, or None for a
+    regular file path.
+    """
+    normalized = path.replace("\\", "/")
+    lower = normalized.lower()
+    i = lower.find(".zip/")
+    while i != -1:
+        if os.path.isfile(path[:i + 4]):
+            return path[:i + 4], normalized[i + 5:]
+        i = lower.find(".zip/", i + 1)
+    return None
+
+def _archive(zip_path):
+    """
+    An open ZipFile for zip_path, reopened if the file has changed.
+    Callers must hold _archives_lock while using it. Raises ValueError if
+    the file is not a valid ZIP archive.
+    """
+    mtime = os.stat(zip_path).st_mtime_ns
+    cached = _open_archives.get(zip_path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    if cached is not None:
+        cached[1].close()
+    try:
+        archive = zipfile.ZipFile(zip_path)
+    except zipfile.BadZipFile:
+        raise ValueError(f"Not a valid ZIP archive: {zip_path}") from None
+    _open_archives[zip_path] = (mtime, archive)
+    return archive
+
+def list_members(zip_path, include=(), exclude=()):
+    """
+    Sorted virtual paths of the images in a ZIP archive. Members in
+    subfolders are always included; include/exclude patterns work as for
+    folders (see discovery.py), matched against the member name.
+    """
+    include, exclude = parse_patterns(include), parse_patterns(exclude)
+    with _archives_lock:
+        names = _archive(zip_path).namelist()
+    paths = []
+    for name in names:
+        base = name.rsplit("/", 1)[-1]
+        if not base.lower().endswith(IMAGE_EXTENSIONS) or base.startswith("."):
+            continue
+        if include and not matches_patterns(name, base, include):
+            continue
+        if exclude and _excluded(name, exclude):
+            continue
+        paths.append(member_path(zip_path, name))
+    paths.sort()
+    return paths
+
+def _excluded(name, exclude):
+    # Like an excluded folder, an excluded member directory hides its contents.
+    parts = name.split("/")
+    for i, part in enumerate(parts):
+        if matches_patterns("/".join(parts[:i + 1]), part, exclude):
+            return True
+    return False
+
+def read_member(path):
+    """
+    The bytes of a virtual member path (see split_member).
+    """
+    zip_path, name = split_member(path)
+    with _archives_lock:
+        try:
+            return _archive(zip_path).read(name)
+        except KeyError:
+            raise FileNotFoundError(f"No member {name} in {zip_path}") from None
+
+def open_input(path):
+    """
+    Something Image.open accepts for an input path: the path itself, or
+    the member's bytes for a path inside an archive.
+    """
+    if split_member(path) is None:
+        return path
+    return io.BytesIO(read_member(path))
+
+def input_stat(path):
+    """
+    (mtime_ns, size) of a file, or of an archive member: the archive's
+    mtime and the member's uncompressed size.
+    """
+    member = split_member(path)
+    if member is None:
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+    zip_path, name = member
+    with _archives_lock:
+        archive = _archive(zip_path)
+        try:
+            info = archive.getinfo(name)
+        except KeyError:
+            raise FileNotFoundError(f"No member {name} in {zip_path}") from None
+        return _open_archives[zip_path][0], info.file_size
+
+class ZipSink:
+    """
+    Output sink that streams encoded images into a ZIP archive. Members are
+    stored uncompressed, since PNG/JPEG/WEBP data is already compressed.
+    The archive is built under a temporary name and renamed into place by
+    close(), so a crash never leaves a truncated archive at zip_path.
+    """
+
+    def __init__(self, zip_path):
+        self.zip_path = zip_path
+        self.count = 0
+        os.makedirs(os.path.dirname(os.path.abspath(zip_path)), exist_ok=True)
+        self._tmp_path = f"{zip_path}.{os.getpid()}.tmp"
+        self._zip = zipfile.ZipFile(self._tmp_path, 'w', zipfile.ZIP_STORED)
+
+    def write(self, data, save_path):
+        """
+        Add data as the member for save_path, a virtual path under zip_path
+        (see engine.get_output_path).
+        """
+        name = os.path.relpath(save_path, self.zip_path).replace(os.sep, "/")
+        self._zip.writestr(name, data)
+        self.count += 1
+
+    def close(self):
+        self._zip.close()
+        os.replace(self._tmp_path, self.zip_path)
@@ -0,0 +1,565 @@
+"""
+benchmark.py
+
+Benchmarks for SnapBack.
+
+    python benchmark.py stages [--quick] [--json results.json]
+        Generates synthetic screenshot and wallpaper corpora (mixed sizes,
+        RGB/RGBA, PNG/JPG/WEBP), times each stage of the batch pipeline
+        separately (read, decode, resize, composite, encode, write) and reports
+        images/sec and peak RSS as JSON, so runs can be compared.
+
+    python benchmark.py workers --bg wallpaper.png --input screenshots/ --workers 1 2 4 8
+        Measures batch throughput for different worker counts.
+
+    python benchmark.py encode [--json encode.json]
+        Composites a generated corpus once, then encodes every composite in
+        each output format with each encoding profile (see encoding.py) and
+        reports encode time against file size.
+
+    python benchmark.py canvas [--size 15360x8640] [--bg-size 7680x4320] [--json canvas.json]
+        Composites screenshots onto a very large PNG canvas with the
+        full-canvas path and with low-memory strips (see strips.py), each in
+        a fresh process, and reports images/sec and peak RSS for both.
+
+    python benchmark.py startup [--runs 5] [--budget-ms 500] [--json startup.json]
+        Starts the GUI in fresh processes and reports the time to import
+        main.py, to the first paint of the window and until the app is
+        ready, plus any heavy modules that were imported eagerly. Exits
+        non-zero if first paint exceeds the budget or a heavy module is
+        imported with main.py, so startup regressions are caught.
+
+Outputs are written to temporary folders that are deleted afterwards.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from PIL import Image, ImageDraw
+import PIL
+from engine import (
+    new_job,
+    get_input_files,
+    run_batch,
+    get_output_mode,
+    prepare_background,
+    prepare_canvas,
+    composite_file,
+    load_overlay,
+    paste_overlay,
+    restore_region,
+    encode_image,
+)
+from encoding import ENCODING_PROFILES, DEFAULT_ENCODING_PROFILE
+from report import STAGES
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Default synthetic corpus: every combination of size, mode and format.
+SCREENSHOT_SIZES = ((1280, 720), (1920, 1080), (2560, 1440), (3840, 2160))
+SCREENSHOT_MODES = ("RGB", "RGBA")
+SCREENSHOT_FORMATS = ("png", "jpg", "webp")
+WALLPAPER_SIZES = ((1920, 1080), (3840, 2160))
+OUTPUT_FORMATS = ("PNG", "JPG", "WEBP")
+
+# Modules that should only load after the window is drawn (see main.py).
+HEAVY_MODULES = ("PIL.Image", "PIL.ImageTk", "engine", "logic", "dragdrop",
+                 "concurrent.futures.process")
+
+# Run in a fresh interpreter by bench_startup; prints one JSON result line.
+STARTUP_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import main
+result = {
+    'import_ms': (time.perf_counter() - start) * 1000,
+    'eager_modules': [m for m in %r if m in sys.modules],
+}
+def first_paint(root):
+    result['first_paint_ms'] = (time.perf_counter() - start) * 1000
+    def ready():
+        result['ready_ms'] = (time.perf_counter() - start) * 1000
+        root.destroy()
+    # Runs after main's own deferred startup, which is queued next.
+    root.after_idle(lambda: root.after_idle(ready))
+try:
+    main.main(on_first_paint=first_paint)
+except Exception as e:  # No display, or tkinterdnd2 missing.
+    result['error'] = f"{type(e).__name__}: {e}"
+print(json.dumps(result))
+""" % (HEAVY_MODULES,)
+
+# Run in a fresh interpreter by bench_canvas, so peak RSS covers one path
+# only; prints time_stages() for the job as one JSON line.
+CANVAS_PROBE = """
+import json, sys
+from benchmark import time_stages
+from engine import get_input_files
+job = json.loads(sys.argv[1])
+print(json.dumps(time_stages(job, get_input_files(job), sys.argv[2])))
+"""
+
+def peak_rss_bytes():
+    """
+    Peak resident set size of this process so far, or None where unsupported.
+    On Linux, VmHWM is used: ru_maxrss carries over across exec, so a
+    probe process would report its parent's peak if that was higher.
+    """
+    try:
+        with open("/proc/self/status", encoding='ascii') as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def make_screenshot(size, mode, rng):
+    """
+    A flat, UI-like image: window chrome, panels and lines of "text".
+    Compresses roughly like a real screenshot, unlike random noise.
+    """
+    w, h = size
+    image = Image.new("RGB", size, (240, 240, 240))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, w, 40), fill=(45, 45, 48))
+    for _ in range(12):
+        x0, y0 = rng.randrange(w), rng.randrange(40, h)
+        x1, y1 = min(w, x0 + rng.randrange(80, w // 2)), min(h, y0 + rng.randrange(40, h // 3))
+        color = tuple(rng.randrange(150, 256) for _ in range(3))
+        draw.rectangle((x0, y0, x1, y1), fill=color, outline=(180, 180, 180))
+    for y in range(60, h, 22):
+        x = 20
+        while x < w - 40:
+            word = rng.randrange(20, 90)
+            draw.line((x, y, min(x + word, w - 20), y), fill=(60, 60, 60), width=6)
+            x += word + 12
+    if mode == "RGBA":
+        image.putalpha(255)
+        draw = ImageDraw.Draw(image)
+        draw.rectangle((0, 0, w, 8), fill=(0, 0, 0, 0))  # Rounded-corner style transparency.
+    return image
+
+def make_wallpaper(size, rng):
+    """
+    A photographic-looking background: a color gradient with grain.
+    """
+    gradient = Image.linear_gradient("L").resize(size)
+    start = tuple(rng.randrange(256) for _ in range(3))
+    end = tuple(rng.randrange(256) for _ in range(3))
+    image = Image.merge("RGB", [
+        gradient.point(lambda v, a=a, b=b: a + (b - a) * v // 255) for a, b in zip(start, end)
+    ])
+    grain = Image.effect_noise(size, 24).convert("RGB")
+    return Image.blend(image, grain, 0.15)
+
+def generate_corpus(folder, seed=0, screenshot_sizes=SCREENSHOT_SIZES,
+                    wallpaper_sizes=WALLPAPER_SIZES):
+    """
+    Write the synthetic corpus into folder. Returns (wallpaper paths, screenshot folder).
+    """
+    rng = random.Random(seed)
+    shots_dir = os.path.join(folder, "screenshots")
+    os.makedirs(shots_dir, exist_ok=True)
+    for w, h in screenshot_sizes:
+        for mode in SCREENSHOT_MODES:
+            image = make_screenshot((w, h), mode, rng)
+            for fmt in SCREENSHOT_FORMATS:
+                if fmt == "jpg" and mode == "RGBA":
+                    continue  # JPEG has no alpha channel.
+                image.save(os.path.join(shots_dir, f"shot_{w}x{h}_{mode.lower()}.{fmt}"))
+
+    wallpapers = []
+    for w, h in wallpaper_sizes:
+        path = os.path.join(folder, f"wallpaper_{w}x{h}.jpg")
+        make_wallpaper((w, h), rng).save(path, quality=92)
+        wallpapers.append(path)
+    return wallpapers, shots_dir
+
+def time_stages(job, input_files, out_folder):
+    """
+    Run the batch pipeline for input_files in this process, timing each stage
+    separately. Returns a result dict with per-stage seconds and images/sec.
+    """
+    canvas = prepare_canvas(job, get_output_mode(job))
+    totals = dict.fromkeys(STAGES, 0.0)
+    output_bytes = 0
+
+    start = time.perf_counter()
+    for file_path in input_files:
+        _, size = composite_file(job, canvas, file_path, out_folder, timings=totals)
+        output_bytes += size
+    elapsed = time.perf_counter() - start
+
+    return {
+        'images': len(input_files),
+        'elapsed': elapsed,
+        'images_per_sec': len(input_files) / elapsed if elapsed > 0 else 0.0,
+        'stages': totals,
+        'output_bytes': output_bytes,
+        'peak_rss_bytes': peak_rss_bytes(),
+    }
+
+def bench_stages(workdir, formats=OUTPUT_FORMATS, scale="90", resample_mode="Best",
+                 screenshot_sizes=SCREENSHOT_SIZES, wallpaper_sizes=WALLPAPER_SIZES,
+                 encoding_profile=DEFAULT_ENCODING_PROFILE):
+    """
+    Generate the corpus in workdir and time the stages for every wallpaper
+    and output format. Returns the full result document.
+    """
+    wallpapers, shots_dir = generate_corpus(workdir, screenshot_sizes=screenshot_sizes,
+                                            wallpaper_sizes=wallpaper_sizes)
+    input_files = sorted(get_input_files(new_job(input_path=shots_dir)))
+    runs = []
+    for wallpaper in wallpapers:
+        for fmt in formats:
+            job = new_job(
+                background_path=wallpaper,
+                input_path=shots_dir,
+                output_format=fmt,
+                resize_scale=scale,
+                resample_mode=resample_mode,
+                encoding_profile=encoding_profile,
+            )
+            with tempfile.TemporaryDirectory(dir=workdir) as out_dir:
+                result = time_stages(job, input_files, out_dir)
+            with Image.open(wallpaper) as img:
+                result['background_size'] = list(img.size)
+            result['output_format'] = fmt
+            runs.append(result)
+
+    return {
+        'benchmark': "stages",
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pillow': PIL.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'settings': {'resize_scale': scale, 'resample_mode': resample_mode,
+                     'encoding_profile': encoding_profile},
+        'corpus': {
+            'screenshots': len(input_files),
+            'screenshot_sizes': [list(s) for s in screenshot_sizes],
+            'wallpaper_sizes': [list(s) for s in wallpaper_sizes],
+        },
+        'runs': runs,
+        'peak_rss_bytes': peak_rss_bytes(),
+    }
+
+def bench_encoding(workdir, formats=OUTPUT_FORMATS, profiles=ENCODING_PROFILES,
+                   screenshot_sizes=SCREENSHOT_SIZES[:2], wallpaper_size=WALLPAPER_SIZES[0]):
+    """
+    Composite every screenshot of a generated corpus once, then encode the
+    composites in each format with each encoding profile. Returns the result
+    document, with one run per (format, profile).
+    """
+    wallpapers, shots_dir = generate_corpus(workdir, screenshot_sizes=screenshot_sizes,
+                                            wallpaper_sizes=(wallpaper_size,))
+    input_files = sorted(get_input_files(new_job(input_path=shots_dir)))
+    canvas = prepare_background(new_job(background_path=wallpapers[0]), "RGBA").copy()
+    composites = []
+    for file_path in input_files:
+        box, saved = paste_overlay(canvas, load_overlay(file_path, 0.9), "Center")
+        composites.append(canvas.copy())
+        restore_region(canvas, box, saved)
+
+    runs = []
+    for fmt in formats:
+        images = [c.convert(get_output_mode(new_job(output_format=fmt))) for c in composites]
+        for profile in profiles:
+            output_bytes = 0
+            start = time.perf_counter()
+            for image in images:
+                output_bytes += len(encode_image(image, fmt, profile=profile))
+            elapsed = time.perf_counter() - start
+            runs.append({
+                'output_format': fmt,
+                'encoding_profile': profile,
+                'images': len(images),
+                'encode_ms': elapsed * 1000 / len(images),
+                'output_bytes': output_bytes // len(images),
+            })
+    for run in runs:
+        balanced = next(r for r in runs if r['output_format'] == run['output_format']
+                        and r['encoding_profile'] == DEFAULT_ENCODING_PROFILE)
+        run['relative_size'] = run['output_bytes'] / balanced['output_bytes']
+        run['relative_time'] = run['encode_ms'] / balanced['encode_ms']
+
+    return {
+        'benchmark': "encode",
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pillow': PIL.__version__,
+        'platform': platform.platform(),
+        'corpus': {
+            'screenshots': len(input_files),
+            'screenshot_sizes': [list(s) for s in screenshot_sizes],
+            'wallpaper_size': list(wallpaper_size),
+        },
+        'runs': runs,
+    }
+
+def print_encoding(results):
+    print(f"{'format':>6} {'profile':>9} {'encode ms':>10} {'KB':>8} {'time':>6} {'size':>6}")
+    for run in results['runs']:
+        print(f"{run['output_format']:>6} {run['encoding_profile']:>9} {run['encode_ms']:>10.1f} "
+              f"{run['output_bytes'] / 1024:>8.0f} {run['relative_time']:>5.2f}x "
+              f"{run['relative_size']:>5.2f}x")
+    print(f"(time and size relative to {DEFAULT_ENCODING_PROFILE})")
+
+def bench_canvas(workdir, size=(15360, 8640), bg_size=None, screenshots=3):
+    """
+    Composite screenshots onto a size canvas (from a bg_size wallpaper,
+    by default as large as the canvas) once with strips off and once with
+    strips always on, each run in a fresh process. Returns the result
+    document, with one run per strip mode.
+    """
+    rng = random.Random(0)
+    bg_size = tuple(bg_size or size)
+    wallpaper = os.path.join(workdir, f"wallpaper_{bg_size[0]}x{bg_size[1]}.jpg")
+    make_wallpaper(bg_size, rng).save(wallpaper, quality=92)
+    shots_dir = os.path.join(workdir, "screenshots")
+    os.makedirs(shots_dir, exist_ok=True)
+    for i in range(screenshots):
+        make_screenshot((3840, 2160), "RGBA", rng).save(os.path.join(shots_dir, f"shot_{i}.png"))
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    runs = []
+    for strip_mode in ("Off", "Always"):
+        job = new_job(
+            background_path=wallpaper,
+            input_path=shots_dir,
+            output_format="PNG",
+            size_preset="Custom",
+            custom_width=str(size[0]),
+            custom_height=str(size[1]),
+            strip_mode=strip_mode,
+        )
+        with tempfile.TemporaryDirectory(dir=workdir) as out_dir:
+            proc = subprocess.run([sys.executable, "-c", CANVAS_PROBE, json.dumps(job), out_dir],
+                                  cwd=here, capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        result['strip_mode'] = strip_mode
+        runs.append(result)
+
+    return {
+        'benchmark': "canvas",
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pillow': PIL.__version__,
+        'platform': platform.platform(),
+        'canvas_size': list(size),
+        'background_size': list(bg_size),
+        'runs': runs,
+    }
+
+def print_canvas(results):
+    print(f"canvas {'x'.join(map(str, results['canvas_size']))} from a "
+          f"{'x'.join(map(str, results['background_size']))} background")
+    print(f"{'strips':>7} {'img/s':>7} {'peak RSS MB':>12} {'output MB':>10}")
+    for run in results['runs']:
+        rss = run['peak_rss_bytes']
+        print(f"{run['strip_mode']:>7} {run['images_per_sec']:>7.2f} "
+              f"{rss / 2**20 if rss else float('nan'):>12.0f} "
+              f"{run['output_bytes'] / run['images'] / 2**20:>10.1f}")
+
+def parse_size(text):
+    width, _, height = text.lower().partition("x")
+    return int(width), int(height)
+
+def bench_workers(job, worker_counts):
+    """
+    Run the same batch once per worker count and return one summary per run,
+    each extended with the speedup relative to the first run.
+    """
+    input_files = get_input_files(job)
+    if not input_files:
+        raise FileNotFoundError("No valid input images found.")
+
+    results = []
+    for workers in worker_counts:
+        with tempfile.TemporaryDirectory() as out_dir:
+            run_job = dict(job, output_folder_option="Custom", custom_output_path=out_dir)
+            summary = run_batch(run_job, input_files, workers, report=False, journal=False)
+            del summary['files']
+        results.append(summary)
+
+    baseline = results[0]['images_per_sec'] or 1.0
+    for summary in results:
+        summary['speedup'] = summary['images_per_sec'] / baseline
+    return results
+
+def bench_startup(runs=5):
+    """
+    Start the GUI runs times, each in a fresh interpreter, and return the
+    per-run results and the medians. Window drawing needs a display; without
+    one only the import timings are measured.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, "-c", STARTUP_PROBE], cwd=here,
+                              capture_output=True, text=True)
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        result['process_ms'] = (time.perf_counter() - start) * 1000
+        results.append(result)
+
+    medians = {}
+    for key in ('import_ms', 'first_paint_ms', 'ready_ms', 'process_ms'):
+        values = [r[key] for r in results if key in r]
+        if values:
+            medians[key] = statistics.median(values)
+    return {
+        'benchmark': "startup",
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'runs': results,
+        'median': medians,
+        'eager_modules': sorted({m for r in results for m in r['eager_modules']}),
+        'error': next((r['error'] for r in results if 'error' in r), None),
+    }
+
+def print_startup(results, budget_ms=None):
+    """
+    Print the startup results. Returns False on a regression: a heavy module
+    imported with main.py, or a median first paint over budget_ms.
+    """
+    for key, label in (('import_ms', "import main"), ('first_paint_ms', "first paint"),
+                       ('ready_ms', "ready"), ('process_ms', "process total")):
+        if key in results['median']:
+            print(f"{label:>14}: {results['median'][key]:8.1f} ms (median)")
+    if results['error']:
+        print(f"window not shown: {results['error']}")
+    ok = True
+    if results['eager_modules']:
+        print("imported eagerly: " + ", ".join(results['eager_modules']))
+        ok = False
+    paint = results['median'].get('first_paint_ms')
+    if budget_ms is not None and paint is not None and paint > budget_ms:
+        print(f"first paint over budget ({budget_ms:.0f} ms)")
+        ok = False
+    return ok
+
+def print_stages(results):
+    print(f"{'background':>11} {'format':>6} {'img/s':>7} " +
+          " ".join(f"{stage + ' ms':>12}" for stage in STAGES))
+    for run in results['runs']:
+        per_image = {k: v * 1000 / max(run['images'], 1) for k, v in run['stages'].items()}
+        print(f"{'x'.join(map(str, run['background_size'])):>11} {run['output_format']:>6} "
+              f"{run['images_per_sec']:>7.2f} " +
+              " ".join(f"{per_image[stage]:>12.1f}" for stage in STAGES))
+    if results['peak_rss_bytes']:
+        print(f"peak RSS: {results['peak_rss_bytes'] / 2**20:.0f} MB")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SnapBack.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    stages = commands.add_parser('stages', help="Per-stage timings on a synthetic corpus")
+    stages.add_argument('--json', help="Write the results to this JSON file")
+    stages.add_argument('--scale', default="90", help="Overlay scale in percent (default: 90)")
+    stages.add_argument('--resample', default="Best", help="Resample mode (default: Best)")
+    stages.add_argument('--quick', action='store_true',
+                        help="Small corpus (two screenshot sizes, one wallpaper) for a fast check")
+    stages.add_argument('--workdir', help="Keep the corpus in this folder instead of a temp folder")
+    stages.add_argument('--encoding', default=DEFAULT_ENCODING_PROFILE, choices=ENCODING_PROFILES,
+                        help=f"Encoding profile (default: {DEFAULT_ENCODING_PROFILE})")
+
+    encode = commands.add_parser('encode', help="Encode time vs. file size per encoding profile")
+    encode.add_argument('--json', help="Write the results to this JSON file")
+
+    canvas = commands.add_parser('canvas', help="Peak memory on a very large canvas, with and without strips")
+    canvas.add_argument('--size', type=parse_size, default=(15360, 8640),
+                        help="Canvas size as WIDTHxHEIGHT (default: 15360x8640)")
+    canvas.add_argument('--bg-size', type=parse_size,
+                        help="Background size as WIDTHxHEIGHT (default: the canvas size)")
+    canvas.add_argument('--json', help="Write the results to this JSON file")
+
+    startup = commands.add_parser('startup', help="GUI import time and time to first paint")
+    startup.add_argument('--runs', type=int, default=5, help="Number of cold starts (default: 5)")
+    startup.add_argument('--budget-ms', type=float,
+                         help="Fail if the median first paint takes longer than this")
+    startup.add_argument('--json', help="Write the results to this JSON file")
+
+    workers = commands.add_parser('workers', help="Throughput per worker count")
+    workers.add_argument('--bg', required=True, help="Background image")
+    workers.add_argument('--input', required=True, help="Input image or folder")
+    workers.add_argument('--workers', type=int, nargs='+', default=[1, os.cpu_count() or 1],
+                         help="Worker counts to compare (default: 1 and all cores)")
+    args = parser.parse_args()
+
+    if args.command == 'stages':
+        options = {'scale': args.scale, 'resample_mode': args.resample,
+                   'encoding_profile': args.encoding}
+        if args.quick:
+            options['screenshot_sizes'] = SCREENSHOT_SIZES[:2]
+            options['wallpaper_sizes'] = WALLPAPER_SIZES[:1]
+        if args.workdir:
+            os.makedirs(args.workdir, exist_ok=True)
+            results = bench_stages(args.workdir, **options)
+        else:
+            with tempfile.TemporaryDirectory() as workdir:
+                results = bench_stages(workdir, **options)
+        print_stages(results)
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+        return
+
+    if args.command == 'encode':
+        with tempfile.TemporaryDirectory() as workdir:
+            results = bench_encoding(workdir)
+        print_encoding(results)
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+        return
+
+    if args.command == 'canvas':
+        with tempfile.TemporaryDirectory() as workdir:
+            results = bench_canvas(workdir, args.size, args.bg_size)
+        print_canvas(results)
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+        return
+
+    if args.command == 'startup':
+        results = bench_startup(args.runs)
+        ok = print_startup(results, args.budget_ms)
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+        sys.exit(0 if ok else 1)
+
+    job = new_job(
+        background_path=args.bg,
+        input_path=args.input,
+        input_type="Folder" if os.path.isdir(args.input) else "File",
+    )
+
+    print(f"{'workers':>8} {'images':>8} {'seconds':>9} {'img/s':>8} {'speedup':>8}")
+    for summary in bench_workers(job, args.workers):
+        print(f"{summary['workers']:>8} {summary['total']:>8} {summary['elapsed']:>9.2f} "
+              f"{summary['images_per_sec']:>8.2f} {summary['speedup']:>7.2f}x")
+
+if __name__ == "__main__":
+    main()
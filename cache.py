@@ -0,0 +1,156 @@
+"""
+cache.py
+
+In-process LRU caches for decoded images, so that prepared backgrounds are
+decoded and resized once and then shared by preview and batch processing.
+
+Cached images are shared: callers must copy() an image before modifying it.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from PIL import Image
+from helpers import open_image_reduced, open_background
+from archive import input_stat, open_input
+
+# Memory caps for the shared caches. An 8K RGBA background is ~130 MB.
+BACKGROUND_CACHE_BYTES = 512 * 1024 * 1024
+PREVIEW_CACHE_BYTES = 128 * 1024 * 1024
+OVERLAY_CACHE_BYTES = 256 * 1024 * 1024
+# Decoded size kept for previews; large enough for a sharp 1000×800 preview.
+PREVIEW_BASE_SIZE = (2000, 1600)
+
+def image_nbytes(image):
+    """
+    Approximate memory used by an image's pixel data.
+    """
+    return image.width * image.height * len(image.getbands())
+
+class ImageCache:
+    """
+    Thread-safe LRU cache of PIL images, bounded by total pixel memory.
+    Least recently used entries are evicted once max_bytes is exceeded.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            image = self._items.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return image
+
+    def put(self, key, image):
+        size = image_nbytes(image)
+        if size > self.max_bytes:
+            return  # Too big to cache; the caller keeps its own reference.
+        with self._lock:
+            if key in self._items:
+                self._bytes -= image_nbytes(self._items.pop(key))
+            self._items[key] = image
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= image_nbytes(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._items),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+background_cache = ImageCache(BACKGROUND_CACHE_BYTES)
+preview_cache = ImageCache(PREVIEW_CACHE_BYTES)
+overlay_cache = ImageCache(OVERLAY_CACHE_BYTES)
+
+def file_identity(path):
+    """
+    Identify a file's (or ZIP member's) current contents by absolute path,
+    mtime and size.
+    """
+    mtime_ns, size = input_stat(path)
+    return (os.path.abspath(path), mtime_ns, size)
+
+def get_background(path, out_size_for, mode="RGBA", use_cache=True):
+    """
+    Return the background at path converted to mode and resized to the output
+    size, from the shared cache when possible.
+
+    :param path: Background image path.
+    :param out_size_for: Callable mapping the original size to the output size
+                         (e.g. lambda size: get_output_size(job, size)).
+    :param mode: Target image mode, e.g. "RGBA" or "RGB".
+    :param use_cache: Without it, the cache is bypassed and the caller gets
+                      a fresh image of its own, which it may modify.
+    """
+    identity = file_identity(path)
+    with open_background(path) as img:
+        out_size = tuple(out_size_for(img.size))
+
+    key = identity + (out_size, mode)
+    background = background_cache.get(key) if use_cache else None
+    if background is None:
+        with open_background(path) as img:
+            background = img.convert(mode)
+        if background.size != out_size:
+            background = background.resize(out_size)
+        if use_cache:
+            background_cache.put(key, background)
+    return background
+
+def get_preview_image(path, size, background=False):
+    """
+    Return the image at path as RGBA resized to size, for previews. Pass
+    background=True for a background image (see helpers.open_background).
+
+    The image is decoded once at reduced scale (see open_image_reduced) into a
+    cached base no larger than PREVIEW_BASE_SIZE. Later calls, e.g. after the
+    scale or size preset changed, only resize that small base; the resized
+    results are cached as well.
+    """
+    size = tuple(size)
+    identity = file_identity(path)
+    sized_key = identity + ("preview", size)
+    image = preview_cache.get(sized_key)
+    if image is not None:
+        return image
+
+    key = identity + ("preview",)
+    base = preview_cache.get(key)
+    if base is None:
+        with (open_background(path) if background else Image.open(open_input(path))) as img:
+            original_size = img.size
+        ratio = min(PREVIEW_BASE_SIZE[0] / original_size[0],
+                    PREVIEW_BASE_SIZE[1] / original_size[1], 1.0)
+        base_size = (max(1, round(original_size[0] * ratio)),
+                     max(1, round(original_size[1] * ratio)))
+        with open_image_reduced(path, base_size, background) as img:
+            base = img.convert("RGBA")
+        if base.size != base_size:
+            base = base.resize(base_size, Image.Resampling.BILINEAR)
+        preview_cache.put(key, base)
+    if base.size == size:
+        return base
+    image = base.resize(size, Image.Resampling.BILINEAR)
+    preview_cache.put(sized_key, image)
+    return image
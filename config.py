@@ -15,15 +15,29 @@ CONFIG_FILE = os.path.join(os.path.expanduser("~"), ".snapback_config.json")
 # Removed 'input_path' and 'input_type'
 DEFAULT_CONFIG = {
     'background_path': "",
+    'recursive': False,
+    'include_patterns': "",
+    'exclude_patterns': "",
+    'matrix_backgrounds': "",
+    'output_template': "",
     'custom_output_path': "",
     'output_folder_option': "Same as input",
     'filename_postfix': "_composited",
     'output_format': "PNG",
+    'renditions': "",
+    'encoding_profile': "Balanced",
     'size_preset': "Same as background",
     'custom_width': "",
     'custom_height': "",
     'position_option': "Center",
     'resize_scale': "90",
+    'resample_mode': "Best",
+    'strip_mode': "Auto",
+    'worker_count': "",
+    'images_in_flight': "",
+    'memory_limit_mb': "512",
+    'incremental': False,
+    'deduplicate': True,
     'window_geometry': "900x700",
 }
 
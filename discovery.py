@@ -0,0 +1,147 @@
+"""
+discovery.py
+
+Input discovery for SnapBack. A single lazy os.scandir walk finds the images
+in a folder, optionally recursing into subfolders and filtering with
+include/exclude glob patterns. Full listings are cached per folder and
+reused for as long as the modification times of the scanned directories
+are unchanged.
+"""
+
+import os
+import threading
+from fnmatch import fnmatch
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+
+# (root, recursive, include, exclude, skip_dirs) -> ({dir: mtime_ns}, [paths])
+_listing_cache = {}
+_listing_lock = threading.Lock()
+
+def parse_patterns(text):
+    """
+    Split a pattern setting such as "*.png; shots/*" into a tuple of globs.
+    """
+    if not text:
+        return ()
+    if isinstance(text, (list, tuple)):
+        return tuple(p.strip() for p in text if p.strip())
+    return tuple(p.strip() for p in text.replace(",", ";").split(";") if p.strip())
+
+def matches_patterns(rel_path, name, patterns):
+    """
+    Patterns containing a slash match the path relative to the root folder;
+    other patterns match the file name.
+    """
+    for pattern in patterns:
+        if fnmatch(rel_path if "/" in pattern else name, pattern):
+            return True
+    return False
+
+def iter_image_entries(folder, recursive=False, include=(), exclude=(), skip_dirs=(),
+                       on_directory=None):
+    """
+    Lazily yield os.DirEntry objects for the images in folder.
+
+    :param recursive: Also walk subfolders.
+    :param include: Glob patterns; when given, only matching images are yielded.
+    :param exclude: Glob patterns for images (or, when recursive, folders) to skip.
+    :param skip_dirs: Folders never to enter, e.g. an output folder inside the input.
+    :param on_directory: Optional callback(path, mtime_ns) for every folder scanned.
+    """
+    include, exclude = parse_patterns(include), parse_patterns(exclude)
+    skip = {os.path.normcase(os.path.abspath(d)) for d in skip_dirs if d}
+    pending = [("", folder)]
+    while pending:
+        rel_dir, current = pending.pop()
+        subfolders = []
+        try:
+            if on_directory:
+                on_directory(current, os.stat(current).st_mtime_ns)
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    rel_path = rel_dir + entry.name
+                    try:
+                        if entry.is_dir():
+                            if (recursive
+                                    and not matches_patterns(rel_path, entry.name, exclude)
+                                    and os.path.normcase(os.path.abspath(entry.path)) not in skip):
+                                subfolders.append((rel_path + "/", entry.path))
+                            continue
+                        if not entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                            continue
+                        if not entry.is_file():
+                            continue
+                    except OSError:
+                        continue  # Deleted or locked while listing.
+                    if include and not matches_patterns(rel_path, entry.name, include):
+                        continue
+                    if exclude and matches_patterns(rel_path, entry.name, exclude):
+                        continue
+                    yield entry
+        except OSError:
+            continue  # Unreadable folder.
+        pending.extend(sorted(subfolders, reverse=True))
+
+def iter_images(folder, **options):
+    """
+    Lazily yield image paths in folder (see iter_image_entries for options).
+    """
+    for entry in iter_image_entries(folder, **options):
+        yield entry.path
+
+def first_image(folder, **options):
+    """
+    The first image found in folder, without listing the rest, or None.
+    """
+    if not os.path.isdir(folder):
+        return None
+    return next(iter_images(folder, **options), None)
+
+def _cache_key(folder, recursive, include, exclude, skip_dirs):
+    return (
+        os.path.abspath(folder),
+        bool(recursive),
+        parse_patterns(include),
+        parse_patterns(exclude),
+        tuple(sorted(os.path.abspath(d) for d in skip_dirs if d)),
+    )
+
+def _is_fresh(dir_mtimes):
+    try:
+        return all(os.stat(d).st_mtime_ns == mtime for d, mtime in dir_mtimes.items())
+    except OSError:
+        return False
+
+def list_images(folder, recursive=False, include=(), exclude=(), skip_dirs=(), on_progress=None):
+    """
+    Sorted list of image paths in folder, served from the listing cache while
+    none of the scanned directories has changed.
+
+    :param on_progress: Optional callback(count) called while a fresh listing
+                        is being built, for streaming counts to the UI.
+    """
+    if not os.path.isdir(folder):
+        return []
+    key = _cache_key(folder, recursive, include, exclude, skip_dirs)
+    with _listing_lock:
+        cached = _listing_cache.get(key)
+    if cached is not None and _is_fresh(cached[0]):
+        if on_progress:
+            on_progress(len(cached[1]))
+        return list(cached[1])
+
+    dir_mtimes = {}
+    paths = []
+    for entry in iter_image_entries(folder, recursive, include, exclude, skip_dirs,
+                                    on_directory=dir_mtimes.__setitem__):
+        paths.append(entry.path)
+        if on_progress and len(paths) % 500 == 0:
+            on_progress(len(paths))
+    paths.sort()
+    if on_progress:
+        on_progress(len(paths))
+
+    with _listing_lock:
+        _listing_cache[key] = (dir_mtimes, paths)
+    return list(paths)
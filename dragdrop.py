@@ -5,7 +5,15 @@ Configures drag-and-drop for background and input image entries in SnapBack.
 """
 
 import os
+import queue
+import threading
 from tkinterdnd2 import DND_FILES
+from discovery import IMAGE_EXTENSIONS
+from archive import is_archive
+from engine import job_from_state, get_input_files
+from ui_components import set_input_files
+
+COUNT_POLL_MS = 100
 
 def configure_drag_and_drop(root, state):
     """
@@ -26,14 +34,16 @@ def handle_background_drop(event, state):
     paths_list = event.widget.tk.splitlist(event.data)
     for raw_path in paths_list:
         clean_path = raw_path.strip('{}')  # remove any curly braces
-        if os.path.isfile(clean_path) and clean_path.lower().endswith(('.png', '.jpg', '.jpeg', '.webp')):
+        if os.path.isfile(clean_path) and clean_path.lower().endswith(IMAGE_EXTENSIONS):
             state['background_path'].set(clean_path)
             return
 
 def handle_input_drop(event, state):
     """
     Process dropped file(s) or folder(s) for the input images.
-    If multiple files are dropped, they are placed in 'Dropped Inputs' subfolder.
+    If multiple files are dropped, they become an input set: the files are
+    processed where they are instead of being copied into a folder.
+    A dropped .zip is read directly, without extracting it.
     """
     # CHANGED: parse paths using splitlist
     paths_list = event.widget.tk.splitlist(event.data)
@@ -41,12 +51,12 @@ def handle_input_drop(event, state):
 
     for raw_path in paths_list:
         clean_path = raw_path.strip('{}')
-        if os.path.isdir(clean_path):
-            state['input_type'].set("Folder")
+        if os.path.isdir(clean_path) or is_archive(clean_path):
+            state['input_type'].set("Folder" if os.path.isdir(clean_path) else "File")
             state['input_path'].set(clean_path)
             update_image_count(state)
             return
-        elif os.path.isfile(clean_path):
+        elif os.path.isfile(clean_path) and clean_path.lower().endswith(IMAGE_EXTENSIONS):
             input_files.append(clean_path)
 
     if input_files:
@@ -55,29 +65,50 @@ def handle_input_drop(event, state):
             state['input_path'].set(input_files[0])
             state['image_count'].set("1 image selected.")
         else:
-            drop_folder = os.path.join(os.path.dirname(input_files[0]), "Dropped Inputs")
-            os.makedirs(drop_folder, exist_ok=True)
-            for img in input_files:
-                basename = os.path.basename(img)
-                target = os.path.join(drop_folder, basename)
-                if not os.path.exists(target):
-                    try:
-                        os.link(img, target)
-                    except Exception:
-                        import shutil
-                        shutil.copy(img, target)
-            state['input_type'].set("Folder")
-            state['input_path'].set(drop_folder)
-            update_image_count(state)
+            set_input_files(state, input_files)
 
 def update_image_count(state):
-    folder = state['input_path'].get()
-    if not os.path.isdir(folder):
+    """
+    Count the images in the input folder in a background thread, streaming
+    the running count to the status bar. Large folders (or network shares)
+    no longer freeze the window, and the listing is cached for processing.
+    """
+    job = job_from_state(state)
+    folder = job['input_path']
+    if not (os.path.isdir(folder) or is_archive(folder)):
         state['image_count'].set("No input folder selected.")
         return
 
-    count = len([
-        f for f in os.listdir(folder)
-        if f.lower().endswith(('.png', '.jpg', '.jpeg', '.webp'))
-    ])
-    state['image_count'].set(f"{count} image(s) found.")
+    # A newer drop supersedes a count that is still running.
+    generation = state.get('count_generation', 0) + 1
+    state['count_generation'] = generation
+    counts = queue.Queue()
+
+    def run():
+        try:
+            files = get_input_files(job, on_progress=lambda n: counts.put(('count', n)))
+            counts.put(('done', len(files)))
+        except Exception as e:  # OSError, or ValueError for a broken ZIP
+            counts.put(('error', str(e)))
+
+    state['image_count'].set("Counting images...")
+    threading.Thread(target=run, daemon=True).start()
+    _poll_image_count(state, counts, generation)
+
+def _poll_image_count(state, counts, generation):
+    if state.get('count_generation') != generation:
+        return
+    while True:
+        try:
+            kind, value = counts.get_nowait()
+        except queue.Empty:
+            break
+        if kind == 'count':
+            state['image_count'].set(f"Counting... {value} image(s) so far.")
+        elif kind == 'done':
+            state['image_count'].set(f"{value} image(s) found.")
+            return
+        else:
+            state['image_count'].set(f"Could not list input folder: {value}")
+            return
+    state['input_entry'].after(COUNT_POLL_MS, _poll_image_count, state, counts, generation)
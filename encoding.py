@@ -0,0 +1,53 @@
+"""
+encoding.py
+
+Encoder settings for SnapBack outputs, as named profiles that trade encode
+time for file size:
+
+- Fast:     PNG compress_level 1, JPG quality 90, WEBP method 0.
+- Balanced: PNG compress_level 6, JPG quality 90, WEBP quality 80 at
+            method 4: Pillow's defaults, and what SnapBack always used.
+- Smallest: PNG compress_level 9 with optimize, JPG quality 85 optimized
+            and progressive, WEBP quality 75 at method 6. Slowest.
+- Quality:  JPG quality 95 without chroma subsampling, lossless WEBP.
+"""
+
+ENCODING_PROFILES = ("Fast", "Balanced", "Smallest", "Quality")
+DEFAULT_ENCODING_PROFILE = "Balanced"
+
+# profile -> format -> Pillow save options
+_PROFILE_OPTIONS = {
+    "Fast": {
+        "png": {"compress_level": 1},
+        "jpg": {"quality": 90},
+        "webp": {"quality": 80, "method": 0},
+    },
+    "Balanced": {
+        "png": {"compress_level": 6},
+        "jpg": {"quality": 90},
+        "webp": {"quality": 80, "method": 4},
+    },
+    "Smallest": {
+        "png": {"compress_level": 9, "optimize": True},
+        "jpg": {"quality": 85, "optimize": True, "progressive": True, "subsampling": "4:2:0"},
+        "webp": {"quality": 75, "method": 6},
+    },
+    "Quality": {
+        "png": {"compress_level": 6},
+        "jpg": {"quality": 95, "optimize": True, "subsampling": "4:4:4"},
+        "webp": {"lossless": True, "quality": 80, "method": 4},
+    },
+}
+
+def save_options(fmt, profile=DEFAULT_ENCODING_PROFILE, quality=None):
+    """
+    Keyword arguments for Image.save in format fmt ("png", "jpg", "webp")
+    under the given profile. quality, if given, overrides the profile's
+    quality for JPG and WEBP (for lossless WEBP, it sets the effort).
+    """
+    fmt = "jpg" if fmt.lower() == "jpeg" else fmt.lower()
+    options = _PROFILE_OPTIONS.get(profile, _PROFILE_OPTIONS[DEFAULT_ENCODING_PROFILE])
+    options = dict(options[fmt])
+    if quality and fmt in ("jpg", "webp"):
+        options["quality"] = quality
+    return options
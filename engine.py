@@ -0,0 +1,799 @@
+"""
+engine.py
+
+Batch engine for SnapBack. Composites a list of input images onto a prepared
+background, spreading the per-file work over a pool of worker processes.
+The engine works on a plain job dictionary instead of tkinter variables, so
+it can be driven by the GUI, the command line or a benchmark alike.
+"""
+
+import io
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from PIL import Image, UnidentifiedImageError
+from config import DEFAULT_CONFIG
+from cache import get_background, file_identity, overlay_cache
+from resample import DEFAULT_RESAMPLE_MODE, resize_image, scaled_size
+from report import stage, file_record, write_report
+from pipeline import DEFAULT_MEMORY_LIMIT_MB, read_input, run_pipeline
+from journal import Journal, journal_header, read_journal, is_completed
+from manifest import (
+    job_settings,
+    load_manifest,
+    save_manifest,
+    is_up_to_date,
+    record_output,
+    forget_output,
+)
+from helpers import (
+    MAX_BACKGROUND_PIXELS,
+    open_background,
+    get_output_folder,
+    get_output_size,
+    calculate_position,
+    safe_scale,
+)
+from discovery import list_images, first_image
+from archive import is_archive, is_zip_name, list_members, split_member, ZipSink
+from strips import LARGE_CANVAS_PIXELS, StripCanvas
+from renditions import parse_renditions, rendition_size
+from encoding import DEFAULT_ENCODING_PROFILE, save_options
+
+# Keys copied from the UI state into a job. Values are kept as the same
+# strings the UI and config file use.
+JOB_KEYS = (
+    'background_path',
+    'input_type',
+    'input_path',
+    'custom_output_path',
+    'output_folder_option',
+    'filename_postfix',
+    'output_format',
+    'size_preset',
+    'custom_width',
+    'custom_height',
+    'position_option',
+    'resize_scale',
+    'worker_count',
+    'incremental',
+    'resample_mode',
+    'recursive',
+    'include_patterns',
+    'exclude_patterns',
+    'images_in_flight',
+    'memory_limit_mb',
+    'matrix_backgrounds',
+    'output_template',
+    'deduplicate',
+    'resume',
+    'strip_mode',
+    'renditions',
+    'encoding_profile',
+)
+
+# Job keys that decide what a canvas looks like, besides the backgrounds
+# themselves and whether there are renditions (see canvas_key).
+CANVAS_KEYS = ('size_preset', 'custom_width', 'custom_height', 'strip_mode', 'output_format',
+               'encoding_profile')
+
+# Output name templates (without extension). A matrix batch needs
+# {background} in the name so outputs for different backgrounds differ.
+DEFAULT_TEMPLATE = "{name}{postfix}"
+MATRIX_TEMPLATE = "{name}_{background}{postfix}"
+
+# Output format names as Pillow knows them.
+PIL_FORMATS = {"png": "PNG", "jpg": "JPEG", "jpeg": "JPEG", "webp": "WEBP"}
+
+def job_from_state(state):
+    """
+    Snapshot the tkinter variables in the UI state into a plain job dictionary.
+    """
+    job = {key: state[key].get() for key in JOB_KEYS}
+    job['input_files'] = list(state.get('input_files') or ())
+    return job
+
+def new_job(**settings):
+    """
+    Build a job from the default config, overridden by the given settings.
+    """
+    job = {key: DEFAULT_CONFIG.get(key, "") for key in JOB_KEYS}
+    job['resume'] = False
+    job['input_type'] = "Folder"
+    job['input_files'] = []
+    job.update(settings)
+    return job
+
+def input_set(paths):
+    """
+    Job fields for an input set: an explicit list of images (e.g. several
+    dropped files) processed in place, without copying them into a folder.
+    input_path is the first image's folder, used for "Same as input" output.
+    """
+    paths = [os.path.abspath(p) for p in paths]
+    return {
+        'input_type': "Files",
+        'input_path': os.path.dirname(paths[0]) if paths else "",
+        'input_files': paths,
+    }
+
+def discovery_options(job):
+    """
+    Input discovery options (see discovery.py) for a job. The output folder
+    is skipped so that a recursive re-run never picks up its own results.
+    """
+    out_folder = get_output_folder(job)
+    in_folder = os.path.abspath(job['input_path'] or ".")
+    skip = (out_folder,) if out_folder and os.path.abspath(out_folder) != in_folder else ()
+    return {
+        'recursive': bool(job.get('recursive')),
+        'include': job.get('include_patterns', ""),
+        'exclude': job.get('exclude_patterns', ""),
+        'skip_dirs': skip,
+    }
+
+def get_input_files(job, on_progress=None):
+    """
+    The input images of a job. on_progress(count) streams the count while a
+    large folder is being listed.
+    """
+    if is_archive(job['input_path']):
+        return list_members(job['input_path'], job.get('include_patterns', ""),
+                            job.get('exclude_patterns', ""))
+    if job['input_type'] == "File":
+        return [job['input_path']]
+    if job['input_type'] == "Files":
+        return [p for p in job['input_files'] if os.path.isfile(p)]
+    return list_images(job['input_path'], on_progress=on_progress, **discovery_options(job))
+
+def get_sample_file(job):
+    """
+    The input used for previews: the input file, or the first image found.
+    """
+    if is_archive(job['input_path']):
+        return next(iter(get_input_files(job)), None)
+    if job['input_type'] == "File":
+        return job['input_path']
+    if job['input_type'] == "Files":
+        return next((p for p in job['input_files'] if os.path.isfile(p)), None)
+    return first_image(job['input_path'], **discovery_options(job))
+
+def get_backgrounds(job):
+    """
+    The backgrounds of a job: background_path, followed by any extra
+    matrix backgrounds (a ";"-separated list). With more than one, every
+    input is composited onto each of them.
+    """
+    extra = [p.strip() for p in job.get('matrix_backgrounds', "").split(";") if p.strip()]
+    return list(dict.fromkeys([job['background_path']] + extra))
+
+def prepare_background(job, mode="RGBA", background_path=None):
+    """
+    Return the job's background (or the given one of its matrix backgrounds)
+    converted to mode and resized to the output size. The image comes from
+    the shared background cache: copy it before modifying it.
+    """
+    return get_background(
+        background_path or job['background_path'],
+        lambda original_size: get_output_size(job, original_size),
+        mode,
+    )
+
+def uses_strips(job, out_size):
+    """
+    Whether outputs of out_size are composited in strips (see strips.py):
+    job['strip_mode'] is "Always", or "Auto" and the canvas has at least
+    LARGE_CANVAS_PIXELS. Strips are only used for PNG output without
+    renditions, which are made from the full composite.
+    """
+    mode = job.get('strip_mode') or "Auto"
+    if mode == "Off" or job['output_format'].lower() != "png" or output_jobs(job)[1:]:
+        return False
+    return mode == "Always" or out_size[0] * out_size[1] >= LARGE_CANVAS_PIXELS
+
+def canvas_key(job):
+    """
+    The job settings that decide what prepare_canvas makes of a background,
+    for reusing canvases across jobs: CANVAS_KEYS, and whether the job has
+    renditions (which rule out strips, see uses_strips).
+    """
+    return tuple(job.get(k) for k in CANVAS_KEYS) + (len(output_jobs(job)) > 1,)
+
+def prepare_canvas(job, mode="RGBA", background_path=None, use_cache=True):
+    """
+    A private, mutable canvas for the job's background (or the given one of
+    its matrix backgrounds) in mode: a copy of the prepared background, or a
+    StripCanvas when the output is composited in strips (see uses_strips).
+
+    Without use_cache the background is prepared straight into the canvas
+    and not kept in the background cache. Pool workers build their canvases
+    once and never read the cache again, so a cached frame would only double
+    their memory.
+    """
+    path = background_path or job['background_path']
+    with open_background(path) as img:
+        out_size = get_output_size(job, img.size)
+    if out_size[0] * out_size[1] > MAX_BACKGROUND_PIXELS:
+        raise ValueError(f"Output size {out_size[0]}×{out_size[1]} is too large "
+                         f"(at most {MAX_BACKGROUND_PIXELS // 1_000_000} megapixels)")
+    if uses_strips(job, out_size):
+        level = save_options("png", job.get('encoding_profile'))["compress_level"]
+        return StripCanvas.open(path, out_size, mode, level)
+    if not use_cache:
+        return get_background(path, lambda original_size: out_size, mode, use_cache=False)
+    return prepare_background(job, mode, path).copy()
+
+def get_output_path(job, file_path, out_folder, background_path=None):
+    """
+    Where the output for file_path (on background_path, by default the
+    job's background) goes. The file name comes from job['output_template'],
+    with {name}, {background} and {postfix} filled in. With recursive
+    discovery, the input's subfolder is mirrored under out_folder so equal
+    names cannot collide; the same goes for folders inside a ZIP input.
+    """
+    postfix = job['filename_postfix'].strip() or "_composited"
+    fmt = job['output_format'].lower()
+    template = job.get('output_template', "").strip()
+    if not template:
+        template = MATRIX_TEMPLATE if len(get_backgrounds(job)) > 1 else DEFAULT_TEMPLATE
+    try:
+        name = template.format(
+            name=os.path.splitext(os.path.basename(file_path))[0],
+            background=os.path.splitext(os.path.basename(background_path or job['background_path']))[0],
+            postfix=postfix,
+        )
+    except (KeyError, IndexError, ValueError):
+        raise ValueError(f"Invalid name template: {template} "
+                         "(use {name}, {background} and {postfix})") from None
+    member = split_member(file_path)
+    if member is not None:
+        rel_dir = os.path.dirname(member[1])
+        if rel_dir:
+            out_folder = os.path.join(out_folder, rel_dir)
+    elif job.get('recursive') and job['input_type'] == "Folder":
+        rel_dir = os.path.relpath(os.path.dirname(os.path.abspath(file_path)),
+                                  os.path.abspath(job['input_path']))
+        if rel_dir != "." and not rel_dir.startswith(".."):
+            out_folder = os.path.join(out_folder, rel_dir)
+    return os.path.join(out_folder, f"{name}.{fmt}")
+
+def output_jobs(job):
+    """
+    The outputs made from each composite, as (job, rendition) pairs: the
+    job itself with rendition None, then one per entry in job['renditions']
+    (see renditions.py), with that rendition's format and postfix.
+    """
+    outputs = [(job, None)]
+    for rendition in parse_renditions(job.get('renditions', "")):
+        outputs.append((dict(job, output_format=rendition['format'],
+                             filename_postfix=rendition['postfix'] or job['filename_postfix']),
+                        rendition))
+    return outputs
+
+def get_output_paths(job, file_path, out_folder):
+    """
+    (background, output path) for every background of the job and every
+    output made from it (see output_jobs), in the order render_outputs
+    returns them.
+    """
+    return [(bg, get_output_path(output_job, file_path, out_folder, bg))
+            for bg in get_backgrounds(job) for output_job, _ in output_jobs(job)]
+
+def get_output_mode(job):
+    """
+    Image mode of the final output: JPEG has no alpha channel.
+    """
+    return "RGB" if job['output_format'].lower() in ["jpg", "jpeg"] else "RGBA"
+
+def has_alpha(image):
+    return image.mode in ("RGBA", "LA", "PA") or 'transparency' in image.info
+
+def decode_overlay(file_path, scale, resample_mode=DEFAULT_RESAMPLE_MODE):
+    """
+    Decode one input, ready for resizing. Returns the image and its original
+    size. Inputs without an alpha channel stay RGB, which makes the resize
+    and the paste cheaper and needs no mask. In "Fast" mode, JPEG inputs
+    that are scaled down are decoded at reduced scale (draft mode), so the
+    image may be smaller than the original size.
+    """
+    image = Image.open(file_path)
+    size = image.size
+    if resample_mode == "Fast" and scale < 1.0 and image.format == "JPEG":
+        image.draft(image.mode, scaled_size(size, scale))
+    return (image.convert("RGBA") if has_alpha(image) else image.convert("RGB")), size
+
+def load_overlay(file_path, scale, resample_mode=DEFAULT_RESAMPLE_MODE, use_cache=False,
+                 timings=None, source=None):
+    """
+    Decode and resize one input (see decode_overlay), adding the time spent
+    to timings['decode'] and timings['resize'] when a timings dict is given.
+    source, if given, is a file object with the contents of file_path
+    (e.g. bytes prefetched by the pipeline) to decode instead of the file.
+
+    With use_cache, the result is kept in the shared overlay cache so
+    repeated composites of the same input skip decoding and resampling; the
+    cached image must not be modified.
+    """
+    key = None
+    if use_cache:
+        key = file_identity(file_path) + (scale, resample_mode)
+        overlay = overlay_cache.get(key)
+        if overlay is not None:
+            return overlay
+
+    with stage(timings, 'decode'):
+        try:
+            image, size = decode_overlay(source or file_path, scale, resample_mode)
+        except UnidentifiedImageError:
+            raise UnidentifiedImageError(f"cannot identify image file {file_path!r}") from None
+    with stage(timings, 'resize'):
+        overlay = resize_image(image, scaled_size(size, scale), resample_mode)
+
+    if key is not None:
+        overlay_cache.put(key, overlay)
+    return overlay
+
+def paste_overlay(canvas, overlay, alignment):
+    """
+    Paste overlay onto canvas in place, touching only the overlay's bounding
+    box. Returns (box, saved) for restore_region, where saved holds the
+    original pixels of that box.
+    """
+    x, y = calculate_position(canvas.size, overlay.size, alignment)
+    box = (max(x, 0), max(y, 0),
+           min(x + overlay.width, canvas.width), min(y + overlay.height, canvas.height))
+    if box[0] >= box[2] or box[1] >= box[3]:
+        return box, None  # Overlay lies entirely outside the canvas.
+
+    saved = canvas.crop(box)
+    mask = overlay if overlay.mode == "RGBA" else None
+    canvas.paste(overlay, (x, y), mask)
+    return box, saved
+
+def restore_region(canvas, box, saved):
+    if saved is not None:
+        canvas.paste(saved, box[:2])
+
+def encode_image(image, fmt, quality=None, profile=DEFAULT_ENCODING_PROFILE):
+    """
+    Encode image in the given output format ("png", "jpg", "webp") with the
+    encoder settings of profile (see encoding.py), and return the file
+    contents as bytes. quality, if given, overrides the profile's quality
+    for JPG and WEBP.
+    """
+    fmt = fmt.lower()
+    buffer = io.BytesIO()
+    image.save(buffer, PIL_FORMATS[fmt], **save_options(fmt, profile, quality))
+    return buffer.getvalue()
+
+def write_output(data, save_path):
+    """
+    Write an output through a temporary file and a rename, so the file is
+    never left half-written and an existing file (possibly hardlinked to
+    other outputs, see link_output) is replaced rather than overwritten.
+    The temporary name is unique per thread, so concurrent writers of one
+    path (as in service.py) never share or move each other's files.
+    """
+    os.makedirs(os.path.dirname(save_path) or ".", exist_ok=True)
+    tmp_path = f"{save_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, save_path)
+
+def link_output(src, save_path):
+    """
+    Make save_path an output identical to src: a hardlink where the file
+    system allows it, a copy otherwise.
+    """
+    if os.path.abspath(src) == os.path.abspath(save_path):
+        return
+    os.makedirs(os.path.dirname(save_path) or ".", exist_ok=True)
+    tmp_path = f"{save_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.link(src, tmp_path)
+    except OSError:
+        shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, save_path)
+
+# Encodes renditions of one composite side by side; Pillow releases the GIL
+# while resizing and encoding. Created on first use in each process: a
+# forked pool worker inherits the parent's executor, but not its threads.
+_rendition_pool = {}
+_rendition_pool_lock = threading.Lock()
+
+def _get_rendition_pool():
+    with _rendition_pool_lock:
+        if _rendition_pool.get('pid') != os.getpid():
+            _rendition_pool['pid'] = os.getpid()
+            _rendition_pool['executor'] = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1))
+        return _rendition_pool['executor']
+
+def encode_rendition(image, output_job, rendition, resample_mode=DEFAULT_RESAMPLE_MODE):
+    """
+    Encode one output of a composite (see output_jobs): the composite as
+    is, or resized and encoded as the rendition asks.
+    """
+    if rendition is None:
+        return encode_image(image, output_job['output_format'],
+                            profile=output_job.get('encoding_profile') or DEFAULT_ENCODING_PROFILE)
+    size = rendition_size(rendition, image.size)
+    if size != image.size:
+        image = resize_image(image, size, resample_mode)
+    if get_output_mode(output_job) == "RGB" and image.mode != "RGB":
+        image = image.convert("RGB")  # JPEG has no alpha channel.
+    return encode_image(image, rendition['format'], rendition['quality'],
+                        output_job.get('encoding_profile') or DEFAULT_ENCODING_PROFILE)
+
+def encode_outputs(job, image):
+    """
+    Encode every output of the job (see output_jobs) from the composite
+    image, renditions in parallel. Returns the encoded bytes in that order.
+    """
+    outputs = output_jobs(job)
+    if len(outputs) == 1 or (os.cpu_count() or 1) == 1:
+        return [encode_rendition(image, output_job, rendition, job['resample_mode'])
+                for output_job, rendition in outputs]
+    futures = [_get_rendition_pool().submit(encode_rendition, image, output_job, rendition,
+                                            job['resample_mode'])
+               for output_job, rendition in outputs]
+    return [future.result() for future in futures]
+
+def encode_composite(job, canvas, overlay, timings=None):
+    """
+    Paste overlay onto canvas, encode the result for every output of the
+    job (see encode_outputs) and restore the canvas. Returns a list of
+    encoded bytes, one per output.
+
+    canvas is a private, mutable copy of a prepared background in the
+    output mode (see get_output_mode). Only the overlay's bounding box is
+    modified, and it is restored before returning, so the same canvas is
+    reused for every file instead of copying and converting the full frame.
+    For a StripCanvas, only the strips the overlay covers are composited.
+    """
+    if isinstance(canvas, StripCanvas):
+        position = calculate_position(canvas.size, overlay.size, job['position_option'])
+        return [canvas.encode(overlay, position, timings)]
+    with stage(timings, 'composite'):
+        box, saved = paste_overlay(canvas, overlay, job['position_option'])
+    try:
+        with stage(timings, 'encode'):
+            return encode_outputs(job, canvas)
+    finally:
+        with stage(timings, 'composite'):
+            restore_region(canvas, box, saved)
+
+def render_outputs(job, canvases, file_path, out_folder, data, use_cache=False, timings=None):
+    """
+    Composite one input, given as the bytes of file_path, onto every canvas
+    of a list of (background path, canvas), and encode each composite for
+    every output of the job, renditions included (see output_jobs). The
+    overlay is decoded and resized once (load_overlay). Returns a list of
+    (output path, encoded bytes); the caller writes them (see write_output).
+    When a timings dict is given, the seconds spent in each stage are added
+    to it. use_cache is passed on to load_overlay.
+    """
+    scale = safe_scale(job['resize_scale']) / 100.0
+
+    overlay = load_overlay(file_path, scale, job['resample_mode'], use_cache, timings,
+                           source=io.BytesIO(data))
+    outputs = []
+    for bg, canvas in canvases:
+        encoded = encode_composite(job, canvas, overlay, timings)
+        outputs += [(get_output_path(output_job, file_path, out_folder, bg), output)
+                    for (output_job, _), output in zip(output_jobs(job), encoded)]
+    return outputs
+
+def composite_file(job, canvas, file_path, out_folder, use_cache=False, timings=None):
+    """
+    Read, composite and save one input (see render_outputs), one stage
+    after the other, renditions included. Returns the path of the job's own
+    output and the number of bytes written in total. Batches use run_batch
+    instead, which overlaps the stages.
+    """
+    data = read_input(file_path, timings)
+    outputs = render_outputs(job, [(job['background_path'], canvas)], file_path, out_folder,
+                             data, use_cache, timings)
+    with stage(timings, 'write'):
+        for save_path, output in outputs:
+            write_output(output, save_path)
+    return outputs[0][0], sum(len(output) for _, output in outputs)
+
+# Per-process state for pool workers, set up once by _init_worker so each
+# background is decoded, resized and copied into a canvas (see
+# prepare_canvas) once per worker rather than per file.
+_worker = {}
+
+def _init_worker(job, out_folder, use_cache=False):
+    _worker['job'] = job
+    _worker['out_folder'] = out_folder
+    _worker['canvases'] = None
+    _worker['use_cache'] = use_cache
+
+def _render_one(file_path, data):
+    """
+    Pipeline compute stage, run in a pool worker (or a thread for inline
+    batches). Returns (error message or None, [(save path, encoded bytes)],
+    timings) as plain data; the parent writes the outputs.
+    """
+    timings = {}
+    try:
+        job = _worker['job']
+        if _worker['canvases'] is None:
+            mode = get_output_mode(job)
+            _worker['canvases'] = [(bg, prepare_canvas(job, mode, bg, _worker['use_cache']))
+                                   for bg in get_backgrounds(job)]
+        outputs = render_outputs(
+            job, _worker['canvases'], file_path, _worker['out_folder'], data,
+            _worker['use_cache'], timings
+        )
+        return None, outputs, timings
+    except Exception as e:
+        return str(e), [], timings
+
+# Canvases kept by workers of an executor shared by several batches (see
+# run_batch), for the most recently used backgrounds and canvas settings.
+_shared_canvases = OrderedDict()
+MAX_SHARED_CANVAS_SETS = 8
+
+def _render_shared(job, out_folder, file_path, data):
+    """
+    Like _render_one, for an executor shared by several batches: the job
+    comes with every call instead of from _init_worker, so a worker serves
+    any batch and keeps its canvases and cached overlays between batches.
+    The executor must run one call at a time per process.
+    """
+    timings = {}
+    try:
+        mode = get_output_mode(job)
+        backgrounds = get_backgrounds(job)
+        key = (tuple(file_identity(bg) for bg in backgrounds), mode, canvas_key(job))
+        canvases = _shared_canvases.get(key)
+        if canvases is None:
+            # The canvases themselves are kept, so the background cache
+            # would only hold a second copy of each frame.
+            canvases = [(bg, prepare_canvas(job, mode, bg, use_cache=False))
+                        for bg in backgrounds]
+            _shared_canvases[key] = canvases
+            while len(_shared_canvases) > MAX_SHARED_CANVAS_SETS:
+                _shared_canvases.popitem(last=False)
+        else:
+            _shared_canvases.move_to_end(key)
+        outputs = render_outputs(job, canvases, file_path, out_folder, data, True, timings)
+        return None, outputs, timings
+    except Exception as e:
+        return str(e), [], timings
+
+def safe_in_flight(value, workers):
+    """
+    Parse the images-in-flight setting. Blank or invalid values allow two
+    images per worker: one being composited and one read ahead or being written.
+    """
+    try:
+        val = int(value)
+        if val <= 0:
+            raise ValueError
+        return max(val, workers)
+    except (TypeError, ValueError):
+        return 2 * workers
+
+def safe_memory_limit(value):
+    """
+    Parse the memory limit setting (MB) into bytes.
+    """
+    try:
+        val = float(value)
+        if val <= 0:
+            raise ValueError
+    except (TypeError, ValueError):
+        val = DEFAULT_MEMORY_LIMIT_MB
+    return int(val * 2**20)
+
+def run_batch(job, input_files, workers=1, on_progress=None, on_error=None, cancel_event=None,
+              report=True, journal=True, executor=None):
+    """
+    Composite every file in input_files according to job.
+
+    :param job: Plain job dictionary (see JOB_KEYS).
+    :param input_files: List of input image paths.
+    :param workers: Number of worker processes. 1 runs in the calling process.
+    :param on_progress: Optional callback(done, total), called in the calling process.
+    :param on_error: Optional callback(file_path, message) for each failed file.
+    :param cancel_event: Optional threading.Event. Once set, no new images are
+                         started; images already being composited are finished.
+    :param report: Write a JSON/CSV run report into the output folder (see report.py).
+    :param journal: Keep a checkpoint journal of completed inputs in the output
+                    folder (see journal.py), so the run can be resumed.
+    :param executor: Optional executor shared with other batches (see jobs.py),
+                     used instead of a pool of the batch's own. It must run one
+                     call at a time per process: a ProcessPoolExecutor, or a
+                     ThreadPoolExecutor with one thread. workers then only
+                     sizes the images in flight.
+    :return: Summary dict with total, processed, skipped, resumed, failed [(path, message)],
+             cancelled, workers, elapsed (seconds), images_per_sec, files
+             (per-file report records), peak_buffered_bytes, duplicates,
+             dedup_saved_seconds and report_path.
+
+    Files stream through the pipeline in pipeline.py: inputs are read ahead
+    and outputs written behind while other images are composited. At most
+    job['images_in_flight'] images (default: two per worker) and
+    job['memory_limit_mb'] of buffered data are held at once.
+
+    With job['deduplicate'] set, byte-identical inputs are composited once;
+    the outputs of the copies are hardlinks (or copies) of the first one's.
+
+    With several backgrounds (see get_backgrounds), each input is decoded
+    and resized once and composited onto every background (a matrix
+    batch); counts and report records are still per input.
+
+    With job['resume'] set, inputs the journal of an interrupted run shows
+    as done are skipped, provided the settings and backgrounds are unchanged;
+    otherwise a ValueError is raised.
+
+    With job['incremental'] set, a manifest in the output folder is used to
+    skip inputs whose outputs are up to date; on_progress then counts only
+    the images that are rebuilt.
+
+    If the output folder is a .zip path, outputs are streamed into that
+    archive (see archive.ZipSink) and the report is written next to it. The
+    archive is rebuilt by every run, so resume, incremental skipping and
+    deduplication links do not apply.
+    """
+    out_folder = get_output_folder(job)
+    sink = None
+    if is_zip_name(out_folder):
+        job = dict(job, resume=False, incremental=False, deduplicate=False)
+        journal = False
+        report_folder = os.path.dirname(os.path.abspath(out_folder))
+        os.makedirs(report_folder, exist_ok=True)
+    else:
+        report_folder = out_folder
+        os.makedirs(out_folder, exist_ok=True)
+
+    # Fail fast on a bad background, name template or renditions list
+    # instead of once per file in every worker.
+    backgrounds = get_backgrounds(job)
+    for bg in backgrounds:
+        with open_background(bg):
+            pass
+    sample_paths = [p for _, p in get_output_paths(job, "input.png", out_folder)]
+    if len(set(sample_paths)) < len(sample_paths):
+        raise ValueError("Renditions would overwrite each other or the main output: "
+                         "give each a different format or postfix.")
+
+    total = len(input_files)
+    files = []  # Per-file report records.
+    settings = {bg: job_settings(dict(job, background_path=bg)) for bg in backgrounds}
+    header = journal_header([settings[bg] for bg in backgrounds], job)
+    resuming = False
+    if job.get('resume'):
+        previous, completed = read_journal(out_folder)
+        if previous is not None:
+            if previous != header:
+                raise ValueError("Cannot resume: the settings or background changed since "
+                                 "the interrupted run. Turn off resume to start over.")
+            resuming = True
+            to_build = []
+            for f in input_files:
+                if is_completed(completed.get(os.path.abspath(f)), f, out_folder):
+                    outputs = get_output_paths(job, f, out_folder)
+                    files.append(file_record(f, "resumed", "; ".join(p for _, p in outputs)))
+                else:
+                    to_build.append(f)
+            input_files = to_build
+    resumed = len(files)
+
+    manifest = None
+    if job.get('incremental'):
+        manifest = load_manifest(out_folder)
+        to_build = []
+        for f in input_files:
+            outputs = get_output_paths(job, f, out_folder)
+            if all(is_up_to_date(manifest, settings[bg], f, save_path, out_folder)
+                   for bg, save_path in outputs):
+                files.append(file_record(f, "skipped", "; ".join(p for _, p in outputs)))
+            else:
+                to_build.append(f)
+        input_files = to_build
+    skipped = len(files) - resumed
+
+    todo = len(input_files)
+    workers = max(1, min(workers, todo))
+    failed = []
+    done = 0
+    start = time.perf_counter()
+
+    checkpoint = Journal(out_folder, header, append=resuming) if journal else None
+
+    def record(file_path, error, outputs, timings, duplicate_of=None):
+        nonlocal done
+        done += 1
+        if checkpoint is not None and not error:
+            checkpoint.record(file_path, [p for p, _ in outputs])
+        if manifest is not None:
+            for bg, output_path in get_output_paths(job, file_path, out_folder):
+                if error:
+                    forget_output(manifest, output_path, out_folder)
+                else:
+                    record_output(manifest, settings[bg], file_path, output_path, out_folder)
+        if error:
+            files.append(file_record(file_path, "failed", error=error, timings=timings))
+            failed.append((file_path, error))
+            if on_error:
+                on_error(file_path, error)
+        else:
+            files.append(file_record(file_path, "duplicate" if duplicate_of else "ok",
+                                     "; ".join(p for p, _ in outputs), timings=timings,
+                                     output_bytes=sum(n for _, n in outputs),
+                                     duplicate_of=duplicate_of or ""))
+        if on_progress:
+            on_progress(done, todo)
+
+    # Resampled overlays are only cached in-process, where the same inputs
+    # come back (watch mode, repeated GUI runs); pool workers are short-lived.
+    if executor is not None:
+        # Workers outlive this batch, so their caches pay off across batches.
+        compute = partial(_render_shared, dict(job, input_files=[]), out_folder)
+        executor_scope = nullcontext(executor)
+    else:
+        _init_worker(job, out_folder, use_cache=(workers == 1))
+        compute = _render_one
+        if workers == 1:
+            executor = ThreadPoolExecutor(max_workers=1)
+        else:
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                           initargs=(job, out_folder))
+        executor_scope = executor
+    dedup = {}
+    if job.get('deduplicate'):
+        dedup = {
+            'output_paths': lambda f: [p for _, p in get_output_paths(job, f, out_folder)],
+            'link': link_output,
+        }
+    if is_zip_name(out_folder):
+        sink = ZipSink(out_folder)
+    stats = {'cancelled': True}
+    try:
+        with executor_scope:
+            stats = run_pipeline(
+                input_files, executor, compute, sink.write if sink else write_output, record,
+                max_in_flight=safe_in_flight(job.get('images_in_flight'), workers),
+                memory_limit=safe_memory_limit(job.get('memory_limit_mb')),
+                cancel_event=cancel_event,
+                workers=workers,
+                **dedup,
+            )
+    finally:
+        if checkpoint is not None:
+            checkpoint.close(cancelled=stats['cancelled'])
+        if sink is not None:
+            sink.close()
+    if compute is _render_one:
+        _worker.clear()
+    if manifest is not None:
+        save_manifest(out_folder, manifest)
+
+    elapsed = time.perf_counter() - start
+    summary = {
+        'total': total,
+        'processed': done - len(failed),
+        'skipped': skipped,
+        'resumed': resumed,
+        'failed': failed,
+        'cancelled': stats['cancelled'],
+        'workers': workers,
+        'elapsed': elapsed,
+        'images_per_sec': done / elapsed if elapsed > 0 else 0.0,
+        'files': files,
+        'peak_buffered_bytes': stats['peak_buffered_bytes'],
+        'duplicates': stats['duplicates'],
+        'dedup_saved_seconds': stats['dedup_saved_seconds'],
+        'report_path': None,
+    }
+    if report:
+        summary['report_path'] = write_report(summary, report_folder)
+    return summary
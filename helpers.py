@@ -1,11 +1,37 @@
 """
 helpers.py
 
-Utility functions for SnapBack: handling paths, image sizes, and scaling.
+Utility functions for SnapBack: handling paths and image sizes.
+All functions take a plain job dictionary (see engine.job_from_state), not
+tkinter variables, so they can be used without a GUI.
 """
 
 import os
+import threading
 from PIL import Image
+from archive import is_archive, open_input
+
+# Pillow refuses images over ~179 MP (and warns over ~89 MP) as possible
+# decompression bombs. Backgrounds are picked by the user, and 16K or
+# multi-monitor wallpapers exceed that, so they are allowed up to
+# MAX_BACKGROUND_PIXELS; inputs keep Pillow's limit.
+MAX_BACKGROUND_PIXELS = 600_000_000
+_bomb_limit_lock = threading.Lock()
+
+def open_background(path):
+    """
+    Image.open for a background image, with the decompression-bomb limit
+    raised to MAX_BACKGROUND_PIXELS. Pillow only checks the limit while
+    opening, so the image can be loaded afterwards as usual.
+    """
+    with _bomb_limit_lock:
+        limit = Image.MAX_IMAGE_PIXELS
+        if limit is not None:
+            Image.MAX_IMAGE_PIXELS = max(limit, MAX_BACKGROUND_PIXELS)
+        try:
+            return Image.open(path)
+        finally:
+            Image.MAX_IMAGE_PIXELS = limit
 
 def safe_scale(scale_str, default=100.0):
     try:
@@ -16,22 +42,35 @@ def safe_scale(scale_str, default=100.0):
     except ValueError:
         return default
 
-def get_output_folder(state):
-    preset = state['output_folder_option'].get()
+def safe_workers(workers_str):
+    """
+    Parse the worker count setting. Blank or invalid values mean "use every core".
+    """
+    cpu_count = os.cpu_count() or 1
+    try:
+        val = int(workers_str)
+        if val <= 0:
+            raise ValueError
+        return val
+    except (TypeError, ValueError):
+        return cpu_count
+
+def get_output_folder(job):
+    preset = job['output_folder_option']
     if preset == "Same as input":
-        in_path = state['input_path'].get()
-        if state['input_type'].get() == "File":
+        in_path = job['input_path']
+        if job['input_type'] == "File" or is_archive(in_path):
             return os.path.dirname(in_path)
         return in_path
     elif preset == "Desktop":
         desktop_path = os.path.join(os.path.expanduser("~"), "Desktop")
         return desktop_path
     elif preset == "Custom":
-        return state['custom_output_path'].get()
+        return job['custom_output_path']
     return ""
 
-def get_output_size(state, original_size):
-    preset = state['size_preset'].get()
+def get_output_size(job, original_size):
+    preset = job['size_preset']
     if preset == "Same as background":
         return original_size
     elif preset == "1920×1080":
@@ -40,8 +79,8 @@ def get_output_size(state, original_size):
         return (1920, 1280)
     elif preset == "Custom":
         try:
-            w = int(state['custom_width'].get())
-            h = int(state['custom_height'].get())
+            w = int(job['custom_width'])
+            h = int(job['custom_height'])
             if w > 0 and h > 0:
                 return (w, h)
             else:
@@ -63,14 +102,19 @@ def calculate_position(bg_size, fg_size, alignment):
     }
     return positions.get(alignment, (0, 0))
 
-def resize_input_relative(image, scale):
+def open_image_reduced(path, target_size, background=False):
     """
-    Resize the image by a given scale (e.g., 1.1 for 110%, 0.9 for 90%).
+    Open an image for display at roughly target_size. JPEGs are decoded at a
+    reduced scale with draft mode; other formats are shrunk with a cheap
+    integer-factor reduce(). The result is at least target_size in each
+    dimension, ready for a final resize. Pass background=True for a
+    background image (see open_background).
     """
-    w, h = image.size
-    new_w = int(w * scale)
-    new_h = int(h * scale)
-    return image.resize((new_w, new_h), Image.Resampling.LANCZOS)
-
-
-
+    image = open_background(path) if background else Image.open(open_input(path))
+    target_w, target_h = max(1, target_size[0]), max(1, target_size[1])
+    if image.format == "JPEG":
+        image.draft(image.mode, (target_w, target_h))
+    factor = min(image.width // target_w, image.height // target_h)
+    if factor >= 2:
+        image = image.reduce(factor)
+    return image
@@ -0,0 +1,234 @@
+"""
+jobs.py
+
+Runs a job spec file: a list of SnapBack jobs executed in one warm process.
+All jobs share one pool of workers, so decoded backgrounds, prepared
+canvases and resampled overlays are reused from job to job instead of
+being rebuilt by every run. Jobs with different output folders run side by
+side; jobs that write into the same folder run one after the other, in
+spec order.
+
+A spec is a JSON or TOML file with an optional "defaults" table and a list
+of "jobs". Their keys are those of config.DEFAULT_CONFIG plus input_path
+(a file, folder or .zip) or input_files (a list of images), and an
+optional name for the job's output lines. Relative paths are relative to
+the spec file. Lists may be used for matrix_backgrounds, include_patterns,
+exclude_patterns and renditions:
+
+    [defaults]
+    background_path = "wall.png"
+    resize_scale = 85
+    renditions = ["WEBP q75 480x270 _thumb"]
+
+    [[jobs]]
+    name = "docs"
+    input_path = "shots/docs"
+    custom_output_path = "out/docs"
+
+    [[jobs]]
+    input_path = "shots/blog"
+    custom_output_path = "out/blog.zip"
+    output_format = "JPG"
+
+Usage:
+    python -m jobs spec.toml [--workers N] [--quiet]
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from config import DEFAULT_CONFIG
+from helpers import get_output_folder, safe_workers
+from engine import new_job, input_set, get_input_files, run_batch
+
+SPEC_KEYS = [key for key in DEFAULT_CONFIG if key != 'window_geometry']
+INPUT_KEYS = ('input_path', 'input_type', 'input_files')
+LIST_KEYS = ('matrix_backgrounds', 'include_patterns', 'exclude_patterns', 'renditions')
+PATH_KEYS = ('background_path', 'custom_output_path', 'input_path')
+
+def load_spec(path):
+    """
+    Read a spec file: TOML for a .toml file, JSON otherwise.
+    """
+    if path.lower().endswith(".toml"):
+        import tomllib
+        with open(path, 'rb') as f:
+            return tomllib.load(f)
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def spec_job(entry, base_dir):
+    """
+    Translate one spec entry (defaults already merged in) into an engine
+    job. Raises ValueError for unknown keys or values of the wrong type.
+    """
+    unknown = sorted(set(entry) - set(SPEC_KEYS) - set(INPUT_KEYS) - {'name'})
+    if unknown:
+        raise ValueError(f"unknown key(s): {', '.join(unknown)}")
+
+    def resolve(path):
+        return os.path.join(base_dir, os.path.expanduser(path))
+
+    settings = {}
+    for key, value in entry.items():
+        if key in ('name', 'input_files'):
+            continue
+        if isinstance(DEFAULT_CONFIG.get(key), bool):
+            if not isinstance(value, bool):
+                raise ValueError(f"{key} must be true or false")
+        elif isinstance(value, list) and key in LIST_KEYS:
+            value = "; ".join(str(v) for v in value)
+        elif isinstance(value, (list, dict)):
+            raise ValueError(f"{key} must be a single value")
+        else:
+            value = str(value)
+        settings[key] = value
+
+    for key in PATH_KEYS:
+        if settings.get(key):
+            settings[key] = resolve(settings[key])
+    if settings.get('matrix_backgrounds'):
+        settings['matrix_backgrounds'] = "; ".join(
+            resolve(p.strip()) for p in settings['matrix_backgrounds'].split(";") if p.strip())
+
+    if entry.get('input_files'):
+        if not isinstance(entry['input_files'], list):
+            raise ValueError("input_files must be a list of images")
+        settings.update(input_set([resolve(str(p)) for p in entry['input_files']]))
+    elif not settings.get('input_path'):
+        raise ValueError("no input_path or input_files")
+    elif 'input_type' not in settings:
+        settings['input_type'] = "Folder" if os.path.isdir(settings['input_path']) else "File"
+    if settings.get('custom_output_path') and 'output_folder_option' not in entry:
+        settings['output_folder_option'] = "Custom"
+    if (settings.get('custom_width') or settings.get('custom_height')) and 'size_preset' not in entry:
+        settings['size_preset'] = "Custom"
+    return new_job(**settings)
+
+def load_jobs(path):
+    """
+    The jobs of a spec file as a list of (name, job). Raises ValueError,
+    naming the job, for an invalid spec.
+    """
+    spec = load_spec(path)
+    if not isinstance(spec, dict) or not isinstance(spec.get('jobs'), list) or not spec['jobs']:
+        raise ValueError("a spec needs a non-empty list of jobs")
+    defaults = spec.get('defaults', {})
+    base_dir = os.path.dirname(os.path.abspath(path))
+    jobs = []
+    for index, entry in enumerate(spec['jobs'], 1):
+        name = f"job {index}"
+        try:
+            if not isinstance(entry, dict):
+                raise ValueError("a job must be a table of settings")
+            name = str(entry.get('name') or name)
+            jobs.append((name, spec_job(dict(defaults, **entry), base_dir)))
+        except ValueError as e:
+            raise ValueError(f"{name}: {e}") from None
+    return jobs
+
+def run_jobs(jobs, workers=1, on_job_done=None):
+    """
+    Run a list of (name, job) in one shared pool of workers (see
+    engine.run_batch). Jobs with the same output folder run one after the
+    other; groups of jobs with different output folders run concurrently.
+
+    :param on_job_done: Optional callback(name, summary, error), called from
+                        the thread that ran the job. summary is None if the
+                        job could not start (error is then its message).
+    :return: List of (name, summary or None, error or None), in spec order.
+    """
+    groups = {}
+    for index, (name, job) in enumerate(jobs):
+        folder = os.path.abspath(get_output_folder(job) or ".")
+        groups.setdefault(folder, []).append(index)
+    results = [None] * len(jobs)
+    queue = list(groups.values())
+    lock = threading.Lock()
+
+    def run_group(executor):
+        while True:
+            with lock:
+                if not queue:
+                    return
+                indexes = queue.pop(0)
+            for index in indexes:
+                name, job = jobs[index]
+                summary, error = None, None
+                try:
+                    input_files = get_input_files(job)
+                    if not input_files:
+                        raise ValueError("no valid input images found")
+                    summary = run_batch(job, input_files, workers, executor=executor)
+                except Exception as e:
+                    error = str(e)
+                results[index] = (name, summary, error)
+                if on_job_done:
+                    on_job_done(name, summary, error)
+
+    # One call at a time per worker, as run_batch requires of a shared pool.
+    if workers == 1:
+        executor = ThreadPoolExecutor(max_workers=1)
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    with executor:
+        threads = [threading.Thread(target=run_group, args=(executor,), daemon=True)
+                   for _ in range(min(len(queue), workers))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="jobs",
+        description="Run a JSON or TOML spec of SnapBack jobs in one process.",
+    )
+    parser.add_argument('spec', help="Job spec file (.json or .toml)")
+    parser.add_argument('--workers', default="", help="Worker processes shared by all jobs "
+                                                      "(default: all cores)")
+    parser.add_argument('--quiet', action='store_true', help="Only print errors")
+    args = parser.parse_args(argv)
+
+    try:
+        jobs = load_jobs(args.spec)
+    except (OSError, ValueError) as e:
+        print(f"jobs: {args.spec}: {e}", file=sys.stderr)
+        return 2
+
+    print_lock = threading.Lock()
+
+    def on_job_done(name, summary, error):
+        with print_lock:
+            if error:
+                print(f"{name}: {error}", file=sys.stderr, flush=True)
+                return
+            for file_path, message in summary['failed']:
+                print(f"{name}: error processing {file_path}: {message}", file=sys.stderr)
+            if not args.quiet:
+                extra = ""
+                if summary['skipped']:
+                    extra += f", {summary['skipped']} up to date"
+                if summary['resumed']:
+                    extra += f", {summary['resumed']} resumed"
+                print(f"{name}: processed {summary['processed']}/{summary['total']} image(s) in "
+                      f"{summary['elapsed']:.2f}s ({summary['images_per_sec']:.1f} img/s{extra}).",
+                      flush=True)
+
+    started = time.perf_counter()
+    results = run_jobs(jobs, safe_workers(args.workers), on_job_done)
+    elapsed = time.perf_counter() - started
+    failed = [name for name, summary, error in results if error or summary['failed']]
+    if not args.quiet:
+        processed = sum(summary['processed'] for _, summary, _ in results if summary)
+        print(f"Ran {len(results)} job(s), {processed} image(s) in {elapsed:.2f}s"
+              + (f"; {len(failed)} job(s) had errors." if failed else "."))
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+journal.py
+
+Checkpoint journal for resumable batches. Every batch appends one JSON line
+per completed input to a journal next to the outputs, so an interrupted run
+(a crash, a closed laptop lid) can be resumed without redoing finished work.
+
+The first line is a header with the settings of the run. A resume is only
+allowed when the current settings and backgrounds match it exactly.
+"""
+
+import os
+import json
+import time
+from manifest import input_identity
+
+JOURNAL_NAME = ".snapback_journal.jsonl"
+JOURNAL_VERSION = 1
+SYNC_INTERVAL = 2.0  # Seconds between fsyncs; lines are flushed immediately.
+
+def journal_header(settings, job):
+    """
+    What must be unchanged for a resume: the pixel settings for each
+    background, in order (see manifest.job_settings), and how outputs are named.
+    """
+    return {
+        'version': JOURNAL_VERSION,
+        'settings': settings,
+        'output_template': job.get('output_template', ""),
+        'filename_postfix': job['filename_postfix'],
+        'recursive': bool(job.get('recursive')),
+    }
+
+def read_journal(out_folder):
+    """
+    Return (header, {input path: entry}) from the journal in out_folder.
+    A missing journal, or one whose run finished, gives (None, {}): there is
+    nothing to resume. Torn lines, left by a crash in the middle of a write,
+    are ignored.
+    """
+    path = os.path.join(out_folder, JOURNAL_NAME)
+    header, entries, finished = None, {}, False
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if header is None:
+                    header = record
+                elif 'input' in record:
+                    entries[record['input']] = record
+                finished = record.get('finished') is True
+    except OSError:
+        pass
+    if finished:
+        return None, {}
+    return header, entries
+
+def is_completed(entry, file_path, out_folder):
+    """
+    True if the journal entry shows file_path, unchanged since, as done and
+    all of its outputs still exist.
+    """
+    if entry is None:
+        return False
+    try:
+        current = input_identity(file_path)
+    except OSError:
+        return False
+    if any(entry.get(k) != v for k, v in current.items()):
+        return False
+    return all(os.path.exists(os.path.join(out_folder, p)) for p in entry['outputs'])
+
+class Journal:
+    """
+    Append-only writer for the journal of one run.
+    """
+
+    def __init__(self, out_folder, header, append=False):
+        self.out_folder = out_folder
+        self.path = os.path.join(out_folder, JOURNAL_NAME)
+        self._file = open(self.path, 'a' if append else 'w', encoding='utf-8')
+        self._last_sync = time.monotonic()
+        if not append:
+            self._write(header)
+        elif self._file.tell() > 0:
+            self._file.write("\n")  # Terminate a line torn by the crash, if any.
+
+    def record(self, file_path, save_paths):
+        entry = input_identity(file_path)
+        entry['outputs'] = [os.path.relpath(p, self.out_folder).replace(os.sep, "/")
+                            for p in save_paths]
+        self._write(entry)
+
+    def close(self, cancelled=False):
+        self._write({'finished': not cancelled})
+        self._sync()
+        self._file.close()
+
+    def _write(self, record):
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        if time.monotonic() - self._last_sync >= SYNC_INTERVAL:
+            self._sync()
+
+    def _sync(self):
+        os.fsync(self._file.fileno())
+        self._last_sync = time.monotonic()
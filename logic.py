@@ -2,119 +2,338 @@
 logic.py
 
 Implements compositing logic for SnapBack (preview + batch processing).
+The heavy lifting for batches is done by engine.run_batch in a background
+thread; this module connects it to the UI state.
 """
 
 import os
-from PIL import Image
-from helpers import (
-    get_output_folder,
-    get_output_size,
-    calculate_position,
-    resize_input_relative,
-    safe_scale
-)
-
-def preview_sample(state):
-    try:
-        bg_path = state['background_path'].get()
-        in_path = state['input_path'].get()
-        if not (bg_path and in_path):
-            raise ValueError("Select background and input first.")
+import queue
+import threading
+import time
+from helpers import get_output_folder, safe_workers
+from engine import job_from_state, get_input_files, get_sample_file, run_batch
+from preview import render_preview, LIVE_PREVIEW_SIZE
+from watch import watch_folder
+from report import throughput_status
 
-        background = Image.open(bg_path).convert("RGBA")
-        out_size = get_output_size(state, background.size)
-        background = background.resize(out_size)
+# How often the Tk thread drains batch events, and how many failed files to list.
+BATCH_POLL_MS = 50
+MAX_ERRORS_SHOWN = 10
 
-        input_type = state['input_type'].get()
-        sample_file = in_path if input_type == "File" else get_first_image_in_folder(in_path)
-        if not sample_file:
-            raise FileNotFoundError("No valid input image found.")
+# Live preview re-renders this long after the last settings change.
+LIVE_PREVIEW_DELAY_MS = 150
+LIVE_PREVIEW_VARS = (
+    'background_path',
+    'input_type',
+    'input_path',
+    'size_preset',
+    'custom_width',
+    'custom_height',
+    'position_option',
+    'resize_scale',
+    'recursive',
+    'include_patterns',
+    'exclude_patterns',
+)
 
-        foreground = Image.open(sample_file).convert("RGBA")
-        scale = safe_scale(state['resize_scale'].get()) / 100.0
-        resized_fg = resize_input_relative(foreground, scale)
+def get_preview_file(job):
+    if not (job['background_path'] and job['input_path']):
+        raise ValueError("Select background and input first.")
 
-        pos = calculate_position(background.size, resized_fg.size, state['position_option'].get())
-        background.paste(resized_fg, pos, resized_fg)
+    sample_file = get_sample_file(job)
+    if not sample_file:
+        raise FileNotFoundError("No valid input image found.")
+    return sample_file
 
-        return background
+def preview_sample(state):
+    try:
+        job = job_from_state(state)
+        return render_preview(job, get_preview_file(job))
     except Exception as e:
         from tkinter import messagebox
         messagebox.showerror("Preview Error", str(e))
         return None
 
+def enable_live_preview(state):
+    """
+    Re-render the docked live preview whenever a setting that affects it changes.
+    Renders are debounced and run in a background thread; the preview caches
+    keep each re-render down to a few small resizes and a paste.
+    """
+    for key in LIVE_PREVIEW_VARS:
+        state[key].trace_add('write', lambda *args: schedule_live_preview(state))
+    schedule_live_preview(state)
+
+def schedule_live_preview(state):
+    label = state['live_preview_label']
+    if state.get('live_preview_after'):
+        label.after_cancel(state['live_preview_after'])
+    state['live_preview_after'] = label.after(LIVE_PREVIEW_DELAY_MS, _start_live_preview, state)
+
+def _start_live_preview(state):
+    state['live_preview_after'] = None
+    if state.get('live_preview_busy'):
+        # Render again once the current one finishes.
+        state['live_preview_dirty'] = True
+        return
+
+    job = job_from_state(state)
+    result = queue.Queue()
+
+    def run():
+        try:
+            result.put(('image', render_preview(job, get_preview_file(job), LIVE_PREVIEW_SIZE)))
+        except Exception as e:
+            result.put(('error', str(e)))
+
+    state['live_preview_busy'] = True
+    state['live_preview_dirty'] = False
+    threading.Thread(target=run, daemon=True).start()
+    _poll_live_preview(state, result)
+
+def _poll_live_preview(state, result):
+    label = state['live_preview_label']
+    try:
+        kind, value = result.get_nowait()
+    except queue.Empty:
+        label.after(BATCH_POLL_MS, _poll_live_preview, state, result)
+        return
+
+    state['live_preview_busy'] = False
+    if kind == 'image':
+        from PIL import ImageTk
+        photo = ImageTk.PhotoImage(value)
+        label.config(image=photo, text="")
+        label.image = photo  # Keep a reference
+    else:
+        label.config(image="", text=value, wraplength=LIVE_PREVIEW_SIZE[0])
+        label.image = None
+    if state['live_preview_dirty']:
+        _start_live_preview(state)
+
 def process_images(state):
+    """
+    Start a batch in a background thread. The thread reports progress, per-file
+    errors and completion through a queue that is drained on the Tk thread by
+    _poll_batch_events, so the window stays responsive during long runs.
+    """
     from tkinter import messagebox
 
-    bg_path = state['background_path'].get()
-    in_path = state['input_path'].get()
-    out_path = get_output_folder(state)
-    postfix = state['filename_postfix'].get().strip() or "_composited"
-    fmt = state['output_format'].get().lower()
-    alignment = state['position_option'].get()
-    scale = safe_scale(state['resize_scale'].get()) / 100.0
+    if state.get('batch_thread') and state['batch_thread'].is_alive():
+        return
+
+    job = job_from_state(state)
+    bg_path = job['background_path']
+    in_path = job['input_path']
+    out_path = get_output_folder(job)
 
     if not (bg_path and in_path and out_path):
         messagebox.showerror("Error", "Please select background, input, and output paths.")
         return
 
-    try:
-        os.makedirs(out_path, exist_ok=True)
-        background = Image.open(bg_path).convert("RGBA")
-        out_size = get_output_size(state, background.size)
-        background = background.resize(out_size)
-
-        if state['input_type'].get() == "File":
-            input_files = [in_path]
-        else:
-            input_files = get_all_images(in_path)
-
-        if not input_files:
-            messagebox.showwarning("No Images", "No valid input images found.")
+    events = queue.Queue()
+    cancel_event = threading.Event()
+
+    def run():
+        try:
+            input_files = get_input_files(job, on_progress=lambda n: events.put(('counting', n)))
+            events.put(('start', len(input_files)))
+            if not input_files:
+                return
+            summary = run_batch(
+                job,
+                input_files,
+                safe_workers(job['worker_count']),
+                on_progress=lambda done, total: events.put(('progress', done, total)),
+                on_error=lambda path, message: events.put(('error', path, message)),
+                cancel_event=cancel_event,
+            )
+            events.put(('done', summary))
+        except Exception as e:
+            events.put(('exception', str(e)))
+
+    state['cancel_event'] = cancel_event
+    state['batch_errors'] = []
+    state['batch_started'] = time.perf_counter()
+    state['batch_thread'] = threading.Thread(target=run, daemon=True)
+    _set_batch_running(state, True)
+    state['batch_thread'].start()
+    _poll_batch_events(state, events)
+
+def cancel_processing(state):
+    """
+    Ask a running batch or folder watch to stop. Images already in progress are finished.
+    """
+    cancel_event = state.get('cancel_event')
+    if cancel_event is not None:
+        cancel_event.set()
+        state['cancel_button'].config(state='disabled')
+    if state.get('watch_stop') is not None:
+        state['watch_stop'].set()
+
+def _set_batch_running(state, running):
+    state['process_button'].config(state='disabled' if running else 'normal')
+    state['cancel_button'].config(state='normal' if running else 'disabled')
+    state['watch_button'].config(state='disabled' if running else 'normal')
+
+def _poll_batch_events(state, events):
+    from tkinter import messagebox
+
+    progress_bar = state['progress_bar']
+    while True:
+        try:
+            event = events.get_nowait()
+        except queue.Empty:
+            break
+
+        kind = event[0]
+        if kind == 'counting':
+            state['image_count'].set(f"Finding images... {event[1]} so far.")
+        elif kind == 'start':
+            total = event[1]
+            progress_bar['maximum'] = max(total, 1)
+            progress_bar['value'] = 0
+            if not total:
+                state['image_count'].set("No images found.")
+                _set_batch_running(state, False)
+                messagebox.showwarning("No Images", "No valid input images found.")
+                return
+        elif kind == 'progress':
+            progress_bar['maximum'] = max(event[2], 1)
+            progress_bar['value'] = event[1]
+            elapsed = time.perf_counter() - state['batch_started']
+            state['image_count'].set(throughput_status(event[1], event[2], elapsed))
+        elif kind == 'error':
+            state['batch_errors'].append((event[1], event[2]))
+        elif kind == 'exception':
+            _set_batch_running(state, False)
+            messagebox.showerror("Processing Error", event[1])
+            return
+        elif kind == 'done':
+            summary = event[1]
+            _set_batch_running(state, False)
+            state['image_count'].set(
+                f"Done: {summary['processed']} image(s) in {summary['elapsed']:.1f}s "
+                f"({summary['images_per_sec']:.1f} img/s)."
+            )
+            _show_batch_summary(state, summary)
             return
 
-        state['progress_bar']['maximum'] = len(input_files)
-        state['progress_bar']['value'] = 0
+    progress_bar.after(BATCH_POLL_MS, _poll_batch_events, state, events)
 
-        for idx, file_path in enumerate(input_files):
-            try:
-                foreground = Image.open(file_path).convert("RGBA")
-                fg_resized = resize_input_relative(foreground, scale)
+def _show_batch_summary(state, summary):
+    from tkinter import messagebox
 
-                bg_copy = background.copy()
-                pos = calculate_position(bg_copy.size, fg_resized.size, alignment)
-                bg_copy.paste(fg_resized, pos, fg_resized)
+    if summary['cancelled']:
+        message = (f"⛔ Cancelled after {summary['processed']} of {summary['total']} image(s).\n"
+                   "Tick \"Resume interrupted run\" to continue later.")
+    else:
+        message = f"✅ Processed {summary['processed']} image(s)."
+    if summary['resumed']:
+        message += f"\n↪ Resumed: {summary['resumed']} image(s) were done by the interrupted run."
+    if summary['skipped']:
+        message += f"\n⏭ Skipped {summary['skipped']} up-to-date image(s)."
+    if summary['duplicates']:
+        message += (f"\n🔗 Linked {summary['duplicates']} duplicate image(s), "
+                    f"saving ~{summary['dedup_saved_seconds']:.1f}s of compositing.")
+    if summary['report_path']:
+        message += f"\n📊 Report: {summary['report_path']}"
 
-                name = os.path.splitext(os.path.basename(file_path))[0]
-                save_path = os.path.join(out_path, f"{name}{postfix}.{fmt}")
+    errors = state['batch_errors']
+    if not errors:
+        messagebox.showinfo("Done", message)
+        return
+    messagebox.showwarning("Done with errors", f"{message}\n\n{_error_lines(errors)}")
 
-                save_kwargs = {"quality": 90} if fmt in ["jpg", "jpeg"] else {}
-                final_mode = "RGB" if fmt in ["jpg", "jpeg"] else "RGBA"
-                bg_copy.convert(final_mode).save(save_path, **save_kwargs)
-            except Exception as e:
-                print(f"⚠️ Error processing {file_path}: {e}")
+def _error_lines(errors):
+    """
+    The failed images of a run, (path, message) pairs, for a summary dialog.
+    """
+    lines = [f"{os.path.basename(path)}: {error}" for path, error in errors[:MAX_ERRORS_SHOWN]]
+    if len(errors) > MAX_ERRORS_SHOWN:
+        lines.append(f"... and {len(errors) - MAX_ERRORS_SHOWN} more.")
+    return f"⚠️ {len(errors)} image(s) failed:\n" + "\n".join(lines)
 
-            state['progress_bar']['value'] = idx + 1
-            state['progress_bar'].update_idletasks()
+def toggle_watch(state):
+    """
+    Start or stop watching the input folder. While watching, new or changed
+    images are composited in a background thread as they arrive.
+    """
+    from tkinter import messagebox
 
-        messagebox.showinfo("Done", f"✅ Processed {len(input_files)} image(s).")
+    if state.get('watch_stop') is not None:
+        state['watch_stop'].set()
+        state['watch_button'].config(state='disabled')
+        return
 
-    except Exception as e:
-        messagebox.showerror("Processing Error", str(e))
+    job = job_from_state(state)
+    if not (job['background_path'] and job['input_path'] and get_output_folder(job)):
+        messagebox.showerror("Error", "Please select background, input, and output paths.")
+        return
+    if job['input_type'] != "Folder":
+        messagebox.showerror("Error", "Watch mode needs an input folder.")
+        return
 
-def get_first_image_in_folder(folder):
-    if not os.path.isdir(folder):
-        return None
-    for f in os.listdir(folder):
-        if f.lower().endswith(('.png', '.jpg', '.jpeg', '.webp')):
-            return os.path.join(folder, f)
-    return None
-
-def get_all_images(folder):
-    if not os.path.isdir(folder):
-        return []
-    return [
-        os.path.join(folder, f)
-        for f in os.listdir(folder)
-        if f.lower().endswith(('.png', '.jpg', '.jpeg', '.webp'))
-    ]
+    events = queue.Queue()
+    stop_event = threading.Event()
+
+    def run():
+        try:
+            watch_folder(
+                job,
+                on_batch=lambda summary: events.put(('batch', summary)),
+                on_error=lambda path, message: events.put(('error', path, message)),
+                stop_event=stop_event,
+            )
+        except Exception as e:
+            events.put(('exception', str(e)))
+        events.put(('stopped',))
+
+    state['watch_stop'] = stop_event
+    state['watch_counts'] = {'processed': 0, 'failed': 0}
+    state['watch_errors'] = []
+    state['watch_button'].config(text="⏹ Stop Watching")
+    state['process_button'].config(state='disabled')
+    state['image_count'].set("👁 Watching for new images...")
+    threading.Thread(target=run, daemon=True).start()
+    _poll_watch_events(state, events)
+
+def _poll_watch_events(state, events):
+    from tkinter import messagebox
+
+    counts = state['watch_counts']
+    errors = state['watch_errors']
+    while True:
+        try:
+            event = events.get_nowait()
+        except queue.Empty:
+            break
+
+        kind = event[0]
+        if kind == 'batch':
+            counts['processed'] += event[1]['processed']
+            counts['failed'] += len(event[1]['failed'])
+            status = f"👁 Watching: {counts['processed']} composited"
+            if counts['failed']:
+                status += f", {counts['failed']} failed"
+            if errors:
+                path, error = errors[-1]
+                status += f" (last error: {os.path.basename(path)}: {error})"
+            state['image_count'].set(status + ".")
+        elif kind == 'error':
+            errors.append((event[1], event[2]))
+        elif kind == 'exception':
+            messagebox.showerror("Watch Error", event[1])
+        elif kind == 'stopped':
+            state['watch_stop'] = None
+            state['watch_button'].config(text="👁 Watch Folder", state='normal')
+            state['process_button'].config(state='normal')
+            if errors:
+                messagebox.showwarning(
+                    "Watch stopped with errors",
+                    f"👁 Composited {counts['processed']} image(s) while watching.\n\n"
+                    + _error_lines(errors),
+                )
+            return
+
+    state['progress_bar'].after(BATCH_POLL_MS, _poll_watch_events, state, events)
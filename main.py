@@ -3,18 +3,25 @@ main.py
 
 Entry point for SnapBack – A tool primarily used to place screenshots on top of a default background.
 Saves user config between sessions, is resizable, and supports drag-and-drop.
+
+Startup is kept short: the window is drawn first, and the modules that pull
+in Pillow and the batch engine (logic, dragdrop, PIL.ImageTk) are imported
+afterwards, or on first use.
 """
 
+import sys
 import tkinter as tk
 from tkinter import ttk
-from tkinterdnd2 import TkinterDnD
-from PIL import ImageTk
 from ui_components import build_ui
-from dragdrop import configure_drag_and_drop
-from logic import preview_sample, process_images
 from config import load_config, save_config
 
-def main():
+def main(on_first_paint=None):
+    """
+    Run the app. on_first_paint(root), if given, is called as soon as the
+    window has been drawn (used by the startup benchmark).
+    """
+    from tkinterdnd2 import TkinterDnD
+
     # Load last-saved user configuration
     user_config = load_config()
 
@@ -37,14 +44,21 @@ def main():
     state = build_ui(root, user_config)
 
     # Connect buttons
-    state['preview_button'].config(command=lambda: show_preview(preview_sample(state)))
-    state['process_button'].config(command=lambda: process_images(state))
+    state['preview_button'].config(command=lambda: _preview(state))
+    state['process_button'].config(command=lambda: _logic().process_images(state))
+    state['cancel_button'].config(command=lambda: _logic().cancel_processing(state))
+    state['watch_button'].config(command=lambda: _logic().toggle_watch(state))
 
-    # Enable drag and drop
-    configure_drag_and_drop(root, state)
+    # Draw the window before loading the engine
+    root.update()
+    if on_first_paint:
+        on_first_paint(root)
+    root.after_idle(lambda: _finish_startup(root, state))
 
     # On close, save config
     def on_closing():
+        if 'logic' in sys.modules:
+            sys.modules['logic'].cancel_processing(state)
         geometry = root.winfo_geometry().split('+')[0]  # e.g. '900x700'
         save_config(state, geometry)
         root.destroy()
@@ -52,21 +66,45 @@ def main():
     root.protocol("WM_DELETE_WINDOW", on_closing)
     root.mainloop()
 
+def _logic():
+    import logic
+    return logic
+
+def _finish_startup(root, state):
+    """
+    The parts of startup that need the engine, run once the window is up.
+    """
+    from dragdrop import configure_drag_and_drop
+
+    # Enable drag and drop
+    configure_drag_and_drop(root, state)
+
+    # Keep the docked preview in sync with the settings
+    _logic().enable_live_preview(state)
+
+def _preview(state):
+    show_preview(_logic().preview_sample(state))
+
 def show_preview(img):
     """
     Create a top-level window to display a composited preview image.
     """
     if img is None:
         return
+    from PIL import ImageTk
+
     win = tk.Toplevel()
     win.title("Preview")
     win.resizable(True, True)
 
-    img.thumbnail((1000, 800))
     img_tk = ImageTk.PhotoImage(img)
     lbl = tk.Label(win, image=img_tk)
     lbl.image = img_tk  # Keep a reference
     lbl.pack(expand=True, fill=tk.BOTH)
 
 if __name__ == "__main__":
+    # Needed for the worker process pool in PyInstaller --onefile builds.
+    # Imported here: multiprocessing is slow to import and only needed for this.
+    import multiprocessing
+    multiprocessing.freeze_support()
     main()
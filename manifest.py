@@ -0,0 +1,89 @@
+"""
+manifest.py
+
+Job manifest for incremental re-runs. A manifest file next to the outputs
+records, for each output, the input file's mtime/size and the settings it
+was built with. Outputs whose input and settings are unchanged are skipped.
+"""
+
+import os
+import json
+from cache import file_identity
+from archive import input_stat
+from helpers import safe_scale
+from encoding import DEFAULT_ENCODING_PROFILE
+
+MANIFEST_NAME = ".snapback_manifest.json"
+MANIFEST_VERSION = 1
+
+def job_settings(job):
+    """
+    The settings that affect the pixels of an output, including the identity
+    of the background file. Two runs with equal settings produce equal outputs.
+    """
+    bg_path, bg_mtime, bg_size = file_identity(job['background_path'])
+    settings = {
+        'background': [bg_path, bg_mtime, bg_size],
+        'scale': safe_scale(job['resize_scale']),
+        'resample_mode': job['resample_mode'],
+        'alignment': job['position_option'],
+        'size_preset': job['size_preset'],
+        'format': job['output_format'].lower(),
+    }
+    if job['size_preset'] == "Custom":
+        settings['custom_size'] = [job['custom_width'], job['custom_height']]
+    profile = job.get('encoding_profile') or DEFAULT_ENCODING_PROFILE
+    if profile != DEFAULT_ENCODING_PROFILE:
+        settings['encoding'] = profile
+    if job.get('renditions', "").strip():
+        settings['renditions'] = job['renditions'].strip()
+    return settings
+
+def input_identity(file_path):
+    mtime_ns, size = input_stat(file_path)
+    return {'input': os.path.abspath(file_path), 'mtime_ns': mtime_ns, 'size': size}
+
+def load_manifest(out_folder):
+    """
+    Load the manifest in out_folder. A missing or unreadable manifest is empty.
+    """
+    path = os.path.join(out_folder, MANIFEST_NAME)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') == MANIFEST_VERSION:
+            return data
+    except (OSError, ValueError):
+        pass
+    return {'version': MANIFEST_VERSION, 'outputs': {}}
+
+def save_manifest(out_folder, manifest):
+    """
+    Write the manifest atomically so an interrupted save never corrupts it.
+    """
+    path = os.path.join(out_folder, MANIFEST_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+def _output_key(save_path, out_folder):
+    return os.path.relpath(save_path, out_folder).replace(os.sep, "/")
+
+def is_up_to_date(manifest, settings, file_path, save_path, out_folder):
+    entry = manifest['outputs'].get(_output_key(save_path, out_folder))
+    if entry is None or not os.path.exists(save_path):
+        return False
+    try:
+        current = input_identity(file_path)
+    except OSError:
+        return False
+    return entry['settings'] == settings and all(entry.get(k) == v for k, v in current.items())
+
+def record_output(manifest, settings, file_path, save_path, out_folder):
+    entry = input_identity(file_path)
+    entry['settings'] = settings
+    manifest['outputs'][_output_key(save_path, out_folder)] = entry
+
+def forget_output(manifest, save_path, out_folder):
+    manifest['outputs'].pop(_output_key(save_path, out_folder), None)
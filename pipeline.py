@@ -0,0 +1,342 @@
+"""
+pipeline.py
+
+Streaming batch pipeline for SnapBack. A reader thread prefetches input
+file bytes, an executor (a thread in-process, or a pool of worker
+processes) decodes, composites and encodes them, and a writer thread saves
+the results, so disk I/O overlaps with compute instead of alternating
+with it.
+
+The stages are connected by bounded queues. At most max_in_flight images
+are between "read" and "written" at any time, and a memory budget caps the
+bytes they hold: input bytes plus an estimate of the decoded frame while an
+image is being composited, and the encoded output until it is written.
+
+Inputs can also be deduplicated by content hash: byte-identical inputs are
+composited once per run, and the outputs of the copies are hardlinked (or
+copied) from the first one's.
+"""
+
+import hashlib
+import io
+import queue
+import threading
+from collections import deque
+from PIL import Image
+from report import stage
+from archive import split_member, read_member
+
+DEFAULT_MEMORY_LIMIT_MB = 512
+_WAIT_SLICE = 0.1  # Seconds between checks for a stop while blocked.
+
+class MemoryBudget:
+    """
+    A byte counter that blocks acquire() while the budget is used up. One
+    item is always admitted when nothing is held, so an image larger than
+    the whole budget is still processed (alone) instead of deadlocking.
+    """
+
+    def __init__(self, limit_bytes):
+        self.limit = limit_bytes
+        self.used = 0
+        self.peak = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, nbytes, stop_event):
+        """
+        Wait until nbytes fit in the budget and take them. Returns False,
+        without taking anything, if stop_event is set while waiting.
+        """
+        with self._cond:
+            while self.used and self.used + nbytes > self.limit:
+                if stop_event.is_set():
+                    return False
+                self._cond.wait(_WAIT_SLICE)
+            self._take(nbytes)
+            return True
+
+    def charge(self, nbytes):
+        """
+        Take nbytes without waiting (for data that already exists, such as an
+        encoded output). Further acquire() calls wait until it is released.
+        """
+        with self._cond:
+            self._take(nbytes)
+
+    def release(self, nbytes):
+        with self._cond:
+            self.used -= nbytes
+            self._cond.notify_all()
+
+    def _take(self, nbytes):
+        self.used += nbytes
+        self.peak = max(self.peak, self.used)
+
+def estimate_cost(data):
+    """
+    Bytes an input will hold while being composited: the file itself plus
+    its decoded RGBA frame and one resized copy. Only the header is parsed.
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            width, height = image.size
+    except Exception:
+        return len(data)  # Unreadable images fail cheaply in the compute stage.
+    return len(data) + width * height * 4 * 2
+
+def read_input(file_path, timings=None):
+    """
+    The bytes of an input file, or of a member inside a ZIP input.
+    """
+    with stage(timings, 'read'):
+        if split_member(file_path) is not None:
+            return read_member(file_path)
+        with open(file_path, 'rb') as f:
+            return f.read()
+
+def content_digest(data):
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+def run_pipeline(input_files, executor, compute, write, on_result, max_in_flight,
+                 memory_limit, cancel_event=None, output_paths=None, link=None, workers=None):
+    """
+    Stream input_files through read -> compute -> write.
+
+    :param executor: concurrent.futures executor that runs compute.
+    :param workers: Images handed to the executor at once (default: no
+                    limit). The rest wait here, where a cancel can drop them;
+                    a process pool starts work it has been given early.
+    :param compute: Picklable callable(file_path, data) returning
+                    (error or None, [(save_path, encoded bytes)], timings).
+    :param write: Callable(data, save_path) run on the writer thread.
+    :param on_result: Callable(file_path, error, [(save_path, output_bytes)], timings,
+                      duplicate_of), called on the calling thread once per
+                      finished image, after its outputs are on disk.
+    :param max_in_flight: Images allowed between being read and being written.
+    :param memory_limit: Byte budget for those images (see MemoryBudget).
+    :param cancel_event: Optional threading.Event. Once set, no more images
+                         are read and images waiting for a worker are
+                         dropped (on_result is not called for them); only
+                         images already being composited are finished.
+    :param output_paths: Optional callable(file_path) returning the save paths
+                         compute would produce, in the same order. Given
+                         together with link, inputs are deduplicated by
+                         content: an input whose bytes equal an earlier
+                         input's is not composited; its outputs are made
+                         with link(src, dst) from the earlier input's outputs,
+                         and duplicate_of names that input.
+    :return: Stats dict with cancelled, peak_buffered_bytes, duplicates and
+             dedup_saved_seconds (compute time the duplicates did not need).
+    """
+    events = queue.Queue()  # Everything the calling thread reacts to.
+    to_write = queue.Queue()  # Bounded by the slots and the budget.
+    slots = threading.Semaphore(max(1, max_in_flight))
+    budget = MemoryBudget(memory_limit)
+    stop = threading.Event()
+    cancel_event = cancel_event or threading.Event()
+    dedup = output_paths is not None and link is not None
+
+    def reader():
+        read = 0
+        try:
+            for file_path in input_files:
+                while not slots.acquire(timeout=_WAIT_SLICE):
+                    if stop.is_set():
+                        return
+                if cancel_event.is_set() or stop.is_set():
+                    slots.release()
+                    return
+                timings = {}
+                try:
+                    data = read_input(file_path, timings)
+                except (OSError, ValueError) as e:  # ValueError: a broken ZIP input
+                    events.put(('failed', file_path, str(e), timings, 0))
+                    read += 1
+                    continue
+                digest = content_digest(data) if dedup else None
+                cost = estimate_cost(data)
+                if not budget.acquire(cost, stop):
+                    slots.release()
+                    return
+                events.put(('read', file_path, data, digest, timings, cost))
+                read += 1
+        finally:
+            events.put(('reader_done', read))
+
+    def writer():
+        while True:
+            item = to_write.get()
+            if item is None:
+                return
+            kind, file_path, outputs, timings = item
+            error = None
+            try:
+                with stage(timings, 'write'):
+                    if kind == 'write':
+                        for save_path, data in outputs:
+                            write(data, save_path)
+                    else:
+                        for src, save_path, _ in outputs:
+                            link(src, save_path)
+            except Exception as e:  # OSError, or an error from a ZIP sink
+                error = str(e)
+            if kind == 'write':
+                written = [(save_path, len(data)) for save_path, data in outputs]
+            else:
+                written = [(save_path, nbytes) for _, save_path, nbytes in outputs]
+            events.put(('written', file_path, error, written, timings))
+
+    threads = [threading.Thread(target=reader, daemon=True),
+               threading.Thread(target=writer, daemon=True)]
+    for thread in threads:
+        thread.start()
+
+    def finish(file_path, error, outputs, timings, cost, duplicate_of=None):
+        budget.release(cost)
+        slots.release()
+        on_result(file_path, error, outputs, timings, duplicate_of)
+
+    finished = 0
+    expected = None
+    # digest -> first input with that content, and the inputs waiting for it.
+    originals = {}
+    # file_path -> digest, for inputs still being composited.
+    digests = {}
+    # duplicate file_path -> original file_path, while its links are written.
+    duplicate_of = {}
+    stats = {'duplicates': 0, 'dedup_saved_seconds': 0.0}
+    pending = set()  # Submitted futures that have not completed.
+    queued = deque()  # Images read but not yet handed to the executor.
+    dropped = 0  # Images given up on by a cancel.
+
+    def drop(file_path, cost):
+        # A cancelled image, and the duplicates waiting for it, end here
+        # without a result.
+        nonlocal finished, dropped
+        budget.release(cost)
+        paths = [file_path]
+        digest = digests.pop(file_path, None)
+        if digest is not None:
+            paths += [p for p, _ in originals[digest]['waiting']]
+            originals[digest]['waiting'] = []
+        for _ in paths:
+            slots.release()
+        finished += len(paths)
+        dropped += len(paths)
+
+    def submit():
+        while queued and (workers is None or len(pending) < workers):
+            file_path, data, timings, cost = queued.popleft()
+            future = executor.submit(compute, file_path, data)
+            pending.add(future)
+            future.add_done_callback(
+                lambda f, p=file_path, t=timings, c=cost: events.put(('computed', p, f, t, c))
+            )
+
+    def link_duplicate(file_path, timings, original):
+        nonlocal finished
+        if original['error']:
+            finished += 1
+            error = f"{original['error']} (same content as {original['path']})"
+            finish(file_path, error, [], timings, 0, original['path'])
+            return
+        sources = original['outputs']
+        stats['duplicates'] += 1
+        stats['dedup_saved_seconds'] += original['compute_seconds']
+        pairs = [(src, dst, nbytes) for (src, nbytes), dst in zip(sources, output_paths(file_path))]
+        duplicate_of[file_path] = original['path']
+        to_write.put(('link', file_path, pairs, timings))
+
+    def settle(file_path, error, outputs, timings):
+        # Resolve the duplicates that waited for file_path.
+        digest = digests.pop(file_path, None)
+        if digest is None:
+            return
+        original = originals[digest]
+        original['error'] = error
+        original['outputs'] = outputs
+        original['compute_seconds'] = sum(v for k, v in timings.items() if k not in ('read', 'write'))
+        waiting, original['waiting'] = original['waiting'], []
+        for dup_path, dup_timings in waiting:
+            link_duplicate(dup_path, dup_timings, original)
+
+    try:
+        while expected is None or finished < expected:
+            try:
+                event = events.get(timeout=_WAIT_SLICE)
+            except queue.Empty:
+                event = None
+            if cancel_event.is_set():
+                while queued:
+                    file_path, _, _, cost = queued.popleft()
+                    drop(file_path, cost)
+                for future in list(pending):
+                    future.cancel()  # Only succeeds for futures not yet started.
+            if event is None:
+                continue
+            kind = event[0]
+            if kind == 'reader_done':
+                expected = event[1]
+            elif kind == 'read':
+                _, file_path, data, digest, timings, cost = event
+                if cancel_event.is_set():
+                    drop(file_path, cost)
+                    continue
+                original = originals.get(digest) if digest else None
+                if original is not None:
+                    budget.release(cost)  # The bytes are not needed.
+                    if original['outputs'] is None and not original['error']:
+                        original['waiting'].append((file_path, timings))
+                    else:
+                        link_duplicate(file_path, timings, original)
+                    continue
+                if digest:
+                    originals[digest] = {'path': file_path, 'outputs': None, 'error': None,
+                                         'waiting': [], 'compute_seconds': 0.0}
+                    digests[file_path] = digest
+                queued.append((file_path, data, timings, cost))
+                submit()
+            elif kind == 'failed':
+                _, file_path, error, timings, cost = event
+                finished += 1
+                finish(file_path, error, [], timings, cost)
+            elif kind == 'computed':
+                _, file_path, future, timings, cost = event
+                pending.discard(future)
+                if not cancel_event.is_set():
+                    submit()
+                if future.cancelled():
+                    drop(file_path, cost)
+                    continue
+                try:
+                    error, outputs, compute_timings = future.result()
+                except Exception as e:  # e.g. a worker process died
+                    error, outputs, compute_timings = str(e), [], {}
+                timings.update(compute_timings)
+                if error:
+                    finished += 1
+                    finish(file_path, error, [], timings, cost)
+                    settle(file_path, error, [], timings)
+                    continue
+                # Hold the encoded bytes instead of the decoded frame.
+                budget.charge(sum(len(data) for _, data in outputs))
+                budget.release(cost)
+                to_write.put(('write', file_path, outputs, timings))
+            elif kind == 'written':
+                _, file_path, error, outputs, timings = event
+                finished += 1
+                if file_path in duplicate_of:
+                    finish(file_path, error, [] if error else outputs, timings, 0,
+                           duplicate_of.pop(file_path))
+                    continue
+                finish(file_path, error, [] if error else outputs, timings,
+                       sum(n for _, n in outputs))
+                settle(file_path, error, [] if error else outputs, timings)
+    finally:
+        stop.set()
+        to_write.put(None)
+        for thread in threads:
+            thread.join()
+    stats['cancelled'] = cancel_event.is_set() and finished - dropped < len(input_files)
+    stats['peak_buffered_bytes'] = budget.peak
+    return stats
@@ -0,0 +1,56 @@
+"""
+preview.py
+
+Fast preview rendering for SnapBack. Instead of compositing at full output
+resolution and shrinking the result, the background and overlay are decoded
+at reduced scale (JPEG draft mode / reduce) and resized straight to the
+preview size, and the composite is done there. The reduced decodes are
+cached, so re-rendering after a settings change only pays for small resizes
+and the paste.
+"""
+
+from PIL import Image
+from cache import get_preview_image
+from archive import open_input
+from helpers import (
+    open_background,
+    get_output_size,
+    calculate_position,
+    safe_scale,
+)
+
+# Largest preview shown in the preview window and in the docked live preview.
+PREVIEW_SIZE = (1000, 800)
+LIVE_PREVIEW_SIZE = (480, 360)
+
+def fit_ratio(size, max_size):
+    """
+    Scale factor that fits size inside max_size without enlarging it.
+    """
+    return min(max_size[0] / size[0], max_size[1] / size[1], 1.0)
+
+def render_preview(job, sample_file, max_size=PREVIEW_SIZE):
+    """
+    Composite sample_file onto the job's background at preview resolution.
+    The result matches the full-size output scaled to fit max_size.
+    """
+    bg_path = job['background_path']
+    with open_background(bg_path) as img:
+        out_size = get_output_size(job, img.size)
+    ratio = fit_ratio(out_size, max_size)
+
+    view_size = (max(1, round(out_size[0] * ratio)), max(1, round(out_size[1] * ratio)))
+    background = get_preview_image(bg_path, view_size, background=True).copy()
+
+    # Work out the overlay's full-resolution size and position, then scale
+    # both by the preview ratio so the preview lines up with the real output.
+    scale = safe_scale(job['resize_scale']) / 100.0
+    with Image.open(open_input(sample_file)) as img:
+        fg_size = (int(img.width * scale), int(img.height * scale))
+    pos = calculate_position(out_size, fg_size, job['position_option'])
+    view_fg_size = (max(1, round(fg_size[0] * ratio)), max(1, round(fg_size[1] * ratio)))
+    view_pos = (round(pos[0] * ratio), round(pos[1] * ratio))
+
+    foreground = get_preview_image(sample_file, view_fg_size)
+    background.paste(foreground, view_pos, foreground)
+    return background
@@ -0,0 +1,68 @@
+"""
+renditions.py
+
+Extra outputs made from each composite, next to the job's own output: for
+example a JPG for email and a small WEBP thumbnail besides the full-size
+PNG. The renditions list is a ";"-separated string. Each entry has a
+format and, optionally, a quality ("q85"), a size ("1280x720" to fit
+inside that box, or "25%") and a postfix ("_thumb"), in any order:
+
+    JPG q85 _email; WEBP q75 480x270 _thumb
+"""
+
+FORMATS = ("PNG", "JPG", "WEBP")
+
+def parse_renditions(text):
+    """
+    Parse a renditions list into dicts with format, quality (None for the
+    format's default), fit ((width, height) or None), percent (or None) and
+    postfix (None to keep the job's postfix). Raises ValueError for an
+    entry that can't be understood.
+    """
+    renditions = []
+    for entry in (text or "").split(";"):
+        if not entry.strip():
+            continue
+        rendition = {'format': None, 'quality': None, 'fit': None, 'percent': None, 'postfix': None}
+        for token in entry.split():
+            lower = token.lower()
+            try:
+                if token.upper() in FORMATS or lower == "jpeg":
+                    rendition['format'] = "JPG" if lower == "jpeg" else token.upper()
+                elif lower.startswith("q") and lower[1:].isdigit():
+                    rendition['quality'] = min(max(int(lower[1:]), 1), 100)
+                elif lower.endswith("%"):
+                    rendition['percent'] = float(lower[:-1])
+                    if rendition['percent'] <= 0:
+                        raise ValueError
+                elif "x" in lower and lower.replace("x", "", 1).isdigit():
+                    width, height = (int(v) for v in lower.split("x"))
+                    if width <= 0 or height <= 0:
+                        raise ValueError
+                    rendition['fit'] = (width, height)
+                elif rendition['postfix'] is None:
+                    rendition['postfix'] = token
+                else:
+                    raise ValueError
+            except ValueError:
+                raise ValueError(f"Invalid rendition {entry.strip()!r}: "
+                                 f"don't know what to do with {token!r}") from None
+        if rendition['format'] is None:
+            raise ValueError(f"Invalid rendition {entry.strip()!r}: "
+                             f"no format (use {', '.join(FORMATS)})")
+        renditions.append(rendition)
+    return renditions
+
+def rendition_size(rendition, size):
+    """
+    Output size of rendition for a composite of size. Fitting inside a box
+    never enlarges the image.
+    """
+    width, height = size
+    if rendition['fit'] is not None:
+        ratio = min(rendition['fit'][0] / width, rendition['fit'][1] / height, 1.0)
+    elif rendition['percent'] is not None:
+        ratio = rendition['percent'] / 100.0
+    else:
+        return size
+    return max(1, round(width * ratio)), max(1, round(height * ratio))
@@ -0,0 +1,113 @@
+"""
+report.py
+
+Per-file instrumentation for SnapBack batches: stage timers used by the
+engine, and the JSON/CSV run report written next to the outputs.
+"""
+
+import os
+import csv
+import json
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from archive import input_stat
+
+REPORT_NAME = ".snapback_report"
+STAGES = ("read", "decode", "resize", "composite", "encode", "write")
+
+@contextmanager
+def stage(timings, name):
+    """
+    Add the time spent in the with-block to timings[name] (seconds).
+    timings may be None, in which case nothing is recorded.
+    """
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+def file_record(file_path, status, save_path="", error="", timings=None, output_bytes=0,
+                duplicate_of=""):
+    """
+    One row of the run report. status is "ok", "failed", "skipped",
+    "resumed" (done by an interrupted run) or "duplicate" (outputs linked from the input named by duplicate_of).
+    """
+    timings = timings or {}
+    try:
+        input_bytes = input_stat(file_path)[1]
+    except OSError:
+        input_bytes = 0
+    record = {
+        'input': file_path,
+        'output': save_path,
+        'status': status,
+        'error': error,
+        'input_bytes': input_bytes,
+        'output_bytes': output_bytes,
+        'duplicate_of': duplicate_of,
+    }
+    for name in STAGES:
+        record[name] = round(timings.get(name, 0.0), 6)
+    record['total'] = round(sum(timings.values()), 6)
+    return record
+
+def format_eta(seconds):
+    seconds = int(seconds + 0.5)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
+
+def throughput_status(done, total, elapsed):
+    """
+    Status bar text with live images/sec and estimated time remaining.
+    """
+    if done <= 0 or elapsed <= 0:
+        return f"{done}/{total} image(s)..."
+    rate = done / elapsed
+    eta = (total - done) / rate
+    return f"{done}/{total} • {rate:.1f} img/s • ETA {format_eta(eta)}"
+
+def write_report(summary, out_folder):
+    """
+    Write the run report as JSON (totals + per-file rows) and CSV (per-file
+    rows) into out_folder. Returns the path of the JSON report.
+    """
+    json_path = os.path.join(out_folder, REPORT_NAME + ".json")
+    csv_path = os.path.join(out_folder, REPORT_NAME + ".csv")
+    files = summary.get('files', [])
+
+    stage_totals = {name: round(sum(r[name] for r in files), 6) for name in STAGES}
+    document = {
+        'finished': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'total': summary['total'],
+        'processed': summary['processed'],
+        'skipped': summary.get('skipped', 0),
+        'resumed': summary.get('resumed', 0),
+        'failed': len(summary['failed']),
+        'cancelled': summary.get('cancelled', False),
+        'workers': summary['workers'],
+        'elapsed': round(summary['elapsed'], 6),
+        'images_per_sec': round(summary['images_per_sec'], 3),
+        'peak_buffered_bytes': summary.get('peak_buffered_bytes', 0),
+        'duplicates': summary.get('duplicates', 0),
+        'dedup_saved_seconds': round(summary.get('dedup_saved_seconds', 0.0), 6),
+        'stage_totals': stage_totals,
+        'files': files,
+    }
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(document, f, indent=2)
+
+    fieldnames = ['input', 'output', 'status', 'error', 'input_bytes', 'output_bytes',
+                  'duplicate_of', *STAGES, 'total']
+    with open(csv_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(files)
+    return json_path
@@ -0,0 +1,43 @@
+"""
+resample.py
+
+Resampling for SnapBack overlays, with selectable speed/quality modes:
+
+- Fast:     BILINEAR after an integer-factor reduce() by as much as
+            possible (reducing_gap=1.0); JPEGs can also use draft decoding.
+- Balanced: LANCZOS after a reduce() for downscales of 4x or more
+            (reducing_gap=2.0); hard to tell apart from Best.
+- Best:     LANCZOS over the full image.
+
+In every mode a resize to the image's own size is skipped.
+"""
+
+from PIL import Image
+
+RESAMPLE_MODES = ("Fast", "Balanced", "Best")
+DEFAULT_RESAMPLE_MODE = "Best"
+
+# mode -> (filter, reducing_gap)
+_RESAMPLE_SETTINGS = {
+    "Fast":     (Image.Resampling.BILINEAR, 1.0),
+    "Balanced": (Image.Resampling.LANCZOS, 2.0),
+    "Best":     (Image.Resampling.LANCZOS, None),
+}
+
+def scaled_size(size, scale):
+    """
+    Size of an image of the given size scaled by scale (e.g. 0.9 for 90%).
+    """
+    w, h = size
+    return (int(w * scale), int(h * scale))
+
+def resize_image(image, size, mode=DEFAULT_RESAMPLE_MODE):
+    """
+    Resize image to size using the given resample mode. Returns image itself
+    when it already has that size.
+    """
+    size = tuple(size)
+    if image.size == size:
+        return image
+    resample, reducing_gap = _RESAMPLE_SETTINGS.get(mode, _RESAMPLE_SETTINGS[DEFAULT_RESAMPLE_MODE])
+    return image.resize(size, resample, reducing_gap=reducing_gap)
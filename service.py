@@ -0,0 +1,484 @@
+"""
+service.py
+
+Local compositing service for SnapBack. Tools that would otherwise start
+SnapBack once per image can keep one service running and send it composite
+requests over localhost HTTP or a Unix socket. Prepared backgrounds (as
+ready canvases) and resampled overlays stay in memory between requests, so
+a request only pays for the work specific to its image.
+
+Usage:
+    python -m service [--port 8765 | --socket /tmp/snapback.sock] [--max-concurrent 4]
+
+Requests:
+    POST /composite  A JSON body {"input": path, "settings": {...}, "output": path},
+                     or the image bytes as the body (Content-Type image/*) with
+                     the settings (and output, name) in the query string.
+                     Settings are job keys (see SETTINGS). Without "output" or
+                     "output_folder" the encoded image is returned in the
+                     response; outputs may only be written under the output
+                     root (--output-root).
+    GET  /stats      Request counts, latency, throughput and cache statistics.
+
+Requests from web pages are refused: a request with an Origin header, or
+(on a port) with a Host other than 127.0.0.1 or localhost, gets a 403. Raw
+bodies must be image/* rather than a type a page may post without a CORS
+preflight.
+"""
+
+import argparse
+import json
+import os
+import socketserver
+import statistics
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+from cache import background_cache, overlay_cache, file_identity
+from report import STAGES, stage
+from pipeline import read_input
+from engine import (
+    canvas_key,
+    new_job,
+    get_output_mode,
+    prepare_canvas,
+    render_outputs,
+    write_output,
+)
+
+DEFAULT_PORT = 8765
+# Job keys a request may set; the rest keep their defaults.
+SETTINGS = (
+    'background_path',
+    'output_format',
+    'size_preset',
+    'custom_width',
+    'custom_height',
+    'position_option',
+    'resize_scale',
+    'resample_mode',
+    'strip_mode',
+    'filename_postfix',
+    'output_template',
+    'encoding_profile',
+)
+CONTENT_TYPES = {"png": "image/png", "jpg": "image/jpeg", "jpeg": "image/jpeg", "webp": "image/webp"}
+MAX_WARM_BACKGROUNDS = 8
+MAX_REQUEST_BYTES = 256 * 2**20
+QUEUE_TIMEOUT = 30.0  # Seconds a request waits for a free slot before a 503.
+LATENCY_WINDOW = 1000  # Requests the latency percentiles are computed over.
+RATE_WINDOW = 60.0  # Seconds the recent throughput is computed over.
+
+class RequestError(ValueError):
+    """
+    A malformed request (HTTP 400).
+    """
+
+class Forbidden(RequestError):
+    """
+    A request the service refuses to carry out (HTTP 403).
+    """
+
+class ServiceBusy(Exception):
+    """
+    No compositing slot became free in time (HTTP 503).
+    """
+
+class CanvasPool:
+    """
+    Idle canvases per background and canvas settings. A canvas is used by
+    one request at a time (see engine.encode_composite), so concurrent
+    requests on the same background each get their own; they come back to
+    the pool afterwards. Canvases for the least recently used backgrounds
+    are dropped beyond max_backgrounds.
+    """
+
+    def __init__(self, max_backgrounds=MAX_WARM_BACKGROUNDS):
+        self.max_backgrounds = max_backgrounds
+        self._idle = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, job, mode):
+        """
+        Return (key, canvas) for job; pass both to release() when done.
+        """
+        key = file_identity(job['background_path']) + canvas_key(job) + (mode,)
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                self._idle.move_to_end(key)
+                return key, idle.pop()
+        return key, prepare_canvas(job, mode)
+
+    def release(self, key, canvas):
+        with self._lock:
+            self._idle.setdefault(key, []).append(canvas)
+            self._idle.move_to_end(key)
+            while len(self._idle) > self.max_backgrounds:
+                self._idle.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backgrounds': len(self._idle),
+                'canvases': sum(len(idle) for idle in self._idle.values()),
+            }
+
+class ServiceStats:
+    """
+    Thread-safe request counters, with latencies and completion times of
+    recent requests for percentiles and throughput.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._finished_at = deque()
+        self._stage_totals = dict.fromkeys(STAGES, 0.0)
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def finish(self, seconds, timings, ok):
+        now = time.monotonic()
+        with self._lock:
+            self.in_flight -= 1
+            if not ok:
+                self.failed += 1
+                return
+            self.completed += 1
+            self._latencies.append(seconds)
+            self._finished_at.append(now)
+            for key, value in timings.items():
+                self._stage_totals[key] = self._stage_totals.get(key, 0.0) + value
+
+    def reject(self):
+        with self._lock:
+            self.rejected += 1
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self._lock:
+            while self._finished_at and now - self._finished_at[0] > RATE_WINDOW:
+                self._finished_at.popleft()
+            latencies = sorted(self._latencies)
+            uptime = now - self.started
+            result = {
+                'uptime_seconds': uptime,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'in_flight': self.in_flight,
+                'images_per_sec': self.completed / uptime if uptime > 0 else 0.0,
+                'recent_images_per_sec': len(self._finished_at) / min(uptime, RATE_WINDOW)
+                                         if uptime > 0 else 0.0,
+                'stage_ms': {k: v * 1000 / max(self.completed, 1)
+                             for k, v in self._stage_totals.items()},
+            }
+        if latencies:
+            result['latency_ms'] = {
+                'mean': statistics.fmean(latencies) * 1000,
+                'p50': latencies[len(latencies) // 2] * 1000,
+                'p95': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+                'max': latencies[-1] * 1000,
+            }
+        return result
+
+class CompositeService:
+    """
+    Composites requests with warm canvases, at most max_concurrent at a time.
+    """
+
+    def __init__(self, defaults=None, max_concurrent=None, output_root=None):
+        """
+        :param defaults: Job settings used where a request sets none,
+                         e.g. {'background_path': ...}.
+        :param max_concurrent: Requests composited at once (default: one
+                               per core). Further requests wait for a slot.
+        :param output_root: Folder that outputs must be written under
+                            (default: the current folder).
+        """
+        self.defaults = dict(defaults or {})
+        self.output_root = os.path.realpath(output_root or os.getcwd())
+        self.max_concurrent = max_concurrent or os.cpu_count() or 1
+        self.canvases = CanvasPool()
+        self.stats = ServiceStats()
+        self._slots = threading.BoundedSemaphore(self.max_concurrent)
+
+    def make_job(self, settings):
+        unknown = sorted(set(settings) - set(SETTINGS))
+        if unknown:
+            raise RequestError(f"Unknown setting: {unknown[0]} (use {', '.join(SETTINGS)})")
+        job = new_job(**self.defaults)
+        job.update({k: v if isinstance(v, str) else str(v) for k, v in settings.items()})
+        if not job['background_path']:
+            raise RequestError("No background_path given")
+        if not os.path.isfile(job['background_path']):
+            raise RequestError(f"Background not found: {job['background_path']}")
+        return job
+
+    def check_output(self, path):
+        """
+        Raise Forbidden unless path is inside the output root.
+        """
+        path = os.path.realpath(path)
+        if os.path.commonpath([path, self.output_root]) != self.output_root:
+            raise Forbidden(f"Outputs must be written under {self.output_root}")
+        return path
+
+    def composite(self, settings, input_path=None, data=None, name=None, output=None,
+                  output_folder=None):
+        """
+        Composite one input, given as input_path or as the image bytes data
+        (named name, for the output name). The result is written to output,
+        or into output_folder under the job's name template, if either is
+        given. Returns a dict with the output path (or None), the encoded
+        bytes as data, the output format and the stage timings.
+        """
+        job = self.make_job(settings)
+        if (input_path is None) == (data is None):
+            raise RequestError("Give either an input path or the image bytes")
+        if input_path is not None and not os.path.isfile(input_path):
+            raise RequestError(f"Input not found: {input_path}")
+        if data is not None and output_folder and not name:
+            # Without a name every request would get the same output name.
+            raise RequestError("Give a name for the image to write it into output_folder")
+        for path in (output, output_folder):
+            if path:
+                self.check_output(path)
+
+        if not self._slots.acquire(timeout=QUEUE_TIMEOUT):
+            self.stats.reject()
+            raise ServiceBusy(f"All {self.max_concurrent} compositing slots are busy")
+        self.stats.start()
+        start = time.perf_counter()
+        timings = {}
+        ok = False
+        try:
+            if input_path is not None:
+                data = read_input(input_path, timings)
+            mode = get_output_mode(job)
+            key, canvas = self.canvases.acquire(job, mode)
+            try:
+                # Resampled overlays are cached for path inputs, which can
+                # come back; posted bytes have no identity to cache by.
+                [(save_path, encoded)] = render_outputs(
+                    job, [(job['background_path'], canvas)], input_path or name or "input.png",
+                    output_folder or "", data, use_cache=input_path is not None, timings=timings
+                )
+            finally:
+                self.canvases.release(key, canvas)
+            if output:
+                save_path = output
+            if output or output_folder:
+                # The name template could still lead out of output_folder.
+                save_path = self.check_output(save_path)
+                with stage(timings, 'write'):
+                    write_output(encoded, save_path)
+            else:
+                save_path = None
+            ok = True
+            return {'output': save_path, 'data': encoded, 'format': job['output_format'],
+                    'timings': timings}
+        finally:
+            self._slots.release()
+            self.stats.finish(time.perf_counter() - start, timings, ok)
+
+    def stats_document(self):
+        document = self.stats.snapshot()
+        document['max_concurrent'] = self.max_concurrent
+        document['warm'] = self.canvases.stats()
+        document['background_cache'] = background_cache.stats()
+        document['overlay_cache'] = overlay_cache.stats()
+        return document
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    server_version = "SnapBack"
+
+    def do_GET(self):
+        if not self._allowed():
+            return
+        if urlsplit(self.path).path == "/stats":
+            self._send_json(200, self.server.service.stats_document())
+        else:
+            self._send_json(404, {'error': "Not found (use POST /composite or GET /stats)"})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/composite":
+            self._send_json(404, {'error': "Not found (use POST /composite or GET /stats)"})
+            return
+        if not self._allowed():
+            return
+        try:
+            length = int(self.headers.get('Content-Length', ""))
+        except ValueError:
+            self._send_json(411, {'error': "Content-Length required"})
+            return
+        if length > MAX_REQUEST_BYTES:
+            self._send_json(413, {'error': f"Request larger than {MAX_REQUEST_BYTES // 2**20} MB"})
+            return
+        body = self.rfile.read(length)
+
+        start = time.perf_counter()
+        try:
+            result = self.server.service.composite(**self._parse(url, body))
+        except Forbidden as e:
+            self._send_json(403, {'error': str(e)})
+            return
+        except RequestError as e:
+            self._send_json(400, {'error': str(e)})
+            return
+        except ServiceBusy as e:
+            self._send_json(503, {'error': str(e)}, {'Retry-After': "1"})
+            return
+        except Exception as e:  # A bad image, an unwritable output...
+            self._send_json(422, {'error': str(e)})
+            return
+        latency_ms = (time.perf_counter() - start) * 1000
+        if result['output'] is None:
+            content_type = CONTENT_TYPES.get(result['format'].lower(), "application/octet-stream")
+            self._send(200, result['data'], content_type, {'X-Latency-Ms': f"{latency_ms:.1f}"})
+        else:
+            self._send_json(200, {
+                'output': result['output'],
+                'bytes': len(result['data']),
+                'latency_ms': latency_ms,
+                'stage_ms': {k: v * 1000 for k, v in result['timings'].items()},
+            })
+
+    def _allowed(self):
+        """
+        Refuse (with a 403) requests that may come from a web page: any
+        request with an Origin header, and on a port, a Host other than the
+        loopback address we listen on (as with DNS rebinding).
+        """
+        hosts = self.server.allowed_hosts
+        if self.headers.get('Origin') is not None:
+            error = "Cross-origin requests are not allowed"
+        elif hosts is not None and self.headers.get('Host', "").lower() not in hosts:
+            error = "Unexpected Host header"
+        else:
+            return True
+        self._send_json(403, {'error': error})
+        return False
+
+    def _parse(self, url, body):
+        """
+        Keyword arguments for CompositeService.composite from a JSON request,
+        or from raw image bytes with the settings in the query string.
+        """
+        content_type = self.headers.get('Content-Type', "").split(";")[0].strip().lower()
+        if content_type == "application/json":
+            try:
+                request = json.loads(body)
+            except ValueError as e:
+                raise RequestError(f"Invalid JSON: {e}") from None
+            if not isinstance(request, dict) or not isinstance(request.get('settings', {}), dict):
+                raise RequestError("Expected a JSON object with an optional settings object")
+            kwargs = {
+                'settings': request.get('settings', {}),
+                'input_path': request.get('input'),
+                'output': request.get('output'),
+                'output_folder': request.get('output_folder'),
+            }
+        elif content_type.startswith("image/"):
+            query = dict(parse_qsl(url.query))
+            kwargs = {
+                'output': query.pop('output', None),
+                'output_folder': query.pop('output_folder', None),
+                'name': query.pop('name', None),
+                'data': body,
+            }
+            kwargs['settings'] = query
+        else:
+            raise RequestError("Send a JSON request (application/json) or the image "
+                               "bytes (image/png, image/jpeg, ...)")
+        return kwargs
+
+    def _send_json(self, status, document, headers=None):
+        self._send(status, json.dumps(document).encode('utf-8'), "application/json", headers)
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Requests are counted in /stats instead.
+
+if hasattr(socketserver, 'UnixStreamServer'):  # Not on Windows.
+    class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+def make_server(service, port=DEFAULT_PORT, socket_path=None):
+    """
+    An HTTP server for service on 127.0.0.1:port, or on the Unix socket at
+    socket_path. A stale socket file left by a previous run is replaced.
+    """
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        server = UnixHTTPServer(socket_path, ServiceHandler)
+        server.allowed_hosts = None  # Not reachable from a browser.
+    else:
+        server = ThreadingHTTPServer(("127.0.0.1", port), ServiceHandler)
+        server.daemon_threads = True
+        port = server.server_address[1]
+        server.allowed_hosts = {f"127.0.0.1:{port}", f"localhost:{port}"}
+    server.service = service
+    return server
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="service",
+        description="Run SnapBack as a local compositing service.",
+    )
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT,
+                        help=f"Port on 127.0.0.1 to listen on (default: {DEFAULT_PORT})")
+    parser.add_argument('--socket', help="Listen on this Unix socket instead of a port")
+    parser.add_argument('--max-concurrent', type=int,
+                        help="Requests composited at once (default: one per core)")
+    parser.add_argument('--bg', default="", help="Background for requests that set none")
+    parser.add_argument('--output-root', default="",
+                        help="Folder outputs may be written under (default: the current folder)")
+    args = parser.parse_args(argv)
+
+    if args.socket and not hasattr(socketserver, 'UnixStreamServer'):
+        print("service: Unix sockets are not supported on this platform.", file=sys.stderr)
+        return 2
+    service = CompositeService({'background_path': args.bg} if args.bg else {},
+                               args.max_concurrent, args.output_root or None)
+    try:
+        server = make_server(service, args.port, args.socket)
+    except OSError as e:
+        print(f"service: {e}", file=sys.stderr)
+        return 1
+    where = args.socket or f"http://127.0.0.1:{args.port}"
+    print(f"SnapBack service on {where}, {service.max_concurrent} at a time (Ctrl+C to stop)...",
+          flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.unlink(args.socket)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,205 @@
+"""
+snapback.py
+
+Headless command-line batch mode for SnapBack. Reuses the compositing engine
+without importing tkinter or any GUI module, so it starts fast and runs on
+machines without a display.
+
+Usage:
+    python -m snapback --bg wall.png --input screenshots/ --out composited/ \\
+        --scale 90 --align Center --format webp
+"""
+
+import argparse
+import os
+import sys
+from helpers import safe_workers
+from resample import RESAMPLE_MODES, DEFAULT_RESAMPLE_MODE
+from encoding import ENCODING_PROFILES, DEFAULT_ENCODING_PROFILE
+from engine import new_job, input_set, get_input_files, run_batch
+from watch import watch_folder
+
+ALIGNMENTS = ("Center", "Top-left", "Top-right", "Bottom-left", "Bottom-right")
+FORMATS = ("PNG", "JPG", "WEBP")
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="snapback",
+        description="Place screenshots on top of a background image.",
+    )
+    parser.add_argument('--bg', required=True, nargs='+',
+                        help="Background image; several make a matrix batch (every input on every background)")
+    parser.add_argument('--input', required=True, nargs='+',
+                        help="Input image, several images, a folder of images, or a .zip of images")
+    parser.add_argument('--recursive', action='store_true', help="Include images in subfolders")
+    parser.add_argument('--include', default="",
+                        help='Only use matching images, e.g. "*.png; shots/*"')
+    parser.add_argument('--exclude', default="", help="Skip matching images or subfolders")
+    parser.add_argument('--out', default="",
+                        help="Output folder, or a .zip to write the outputs into "
+                             "(default: same folder as the input)")
+    parser.add_argument('--scale', default="90", help="Overlay size in percent (default: 90)")
+    parser.add_argument('--align', default="Center", choices=ALIGNMENTS,
+                        help="Overlay position (default: Center)")
+    parser.add_argument('--format', default="PNG", type=str.upper, choices=FORMATS,
+                        help="Output format (default: PNG)")
+    parser.add_argument('--encoding', default=DEFAULT_ENCODING_PROFILE, type=str.capitalize,
+                        choices=ENCODING_PROFILES,
+                        help=f"Encoder settings, from fastest to smallest files "
+                             f"(default: {DEFAULT_ENCODING_PROFILE})")
+    parser.add_argument('--rendition', action='append', default=[],
+                        help='Extra output made from each composite, e.g. "JPG q85 _email" or '
+                             '"WEBP q75 480x270 _thumb" (repeatable)')
+    parser.add_argument('--resample', default=DEFAULT_RESAMPLE_MODE, type=str.capitalize,
+                        choices=RESAMPLE_MODES,
+                        help=f"Overlay resampling quality (default: {DEFAULT_RESAMPLE_MODE})")
+    parser.add_argument('--size', default="",
+                        help="Output size as WIDTHxHEIGHT (default: same as background)")
+    parser.add_argument('--strips', default="Auto", type=str.capitalize,
+                        choices=("Auto", "Always", "Off"),
+                        help="Composite PNG outputs in strips to bound memory (default: Auto, "
+                             "for canvases over 40 megapixels)")
+    parser.add_argument('--name', default="",
+                        help="Output name template using {name}, {background} and {postfix} "
+                             "(default: {name}{postfix}, or {name}_{background}{postfix} for several backgrounds)")
+    parser.add_argument('--postfix', default="_composited",
+                        help="Appended to output filenames (default: _composited)")
+    parser.add_argument('--workers', default="",
+                        help="Worker processes (default: all cores)")
+    parser.add_argument('--in-flight', default="",
+                        help="Images read ahead / written behind at once (default: 2 per worker)")
+    parser.add_argument('--memory-limit', default="512",
+                        help="Memory ceiling in MB for buffered images (default: 512)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Skip inputs whose output is up to date (uses a manifest in the output folder)")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue an interrupted run, skipping the inputs its journal shows as done")
+    parser.add_argument('--no-dedup', action='store_true',
+                        help="Composite byte-identical inputs separately instead of linking their outputs")
+    parser.add_argument('--watch', action='store_true',
+                        help="Keep running and composite new images as they arrive in the input folder")
+    parser.add_argument('--quiet', action='store_true', help="Only print errors")
+    return parser
+
+def job_from_args(args):
+    """
+    Translate parsed command-line arguments into an engine job.
+    """
+    if len(args.input) > 1:
+        inputs = input_set(args.input)
+    else:
+        path = args.input[0]
+        inputs = {'input_path': path, 'input_type': "Folder" if os.path.isdir(path) else "File"}
+    job = new_job(
+        background_path=args.bg[0],
+        matrix_backgrounds="; ".join(args.bg[1:]),
+        output_template=args.name,
+        **inputs,
+        resize_scale=args.scale,
+        position_option=args.align,
+        resample_mode=args.resample,
+        strip_mode=args.strips,
+        output_format=args.format,
+        renditions="; ".join(args.rendition),
+        encoding_profile=args.encoding,
+        filename_postfix=args.postfix,
+        worker_count=args.workers,
+        images_in_flight=args.in_flight,
+        memory_limit_mb=args.memory_limit,
+        incremental=args.incremental,
+        deduplicate=not args.no_dedup,
+        resume=args.resume,
+        recursive=args.recursive,
+        include_patterns=args.include,
+        exclude_patterns=args.exclude,
+    )
+    if args.out:
+        job['output_folder_option'] = "Custom"
+        job['custom_output_path'] = args.out
+    else:
+        job['output_folder_option'] = "Same as input"
+    if args.size:
+        width, _, height = args.size.lower().partition("x")
+        job['size_preset'] = "Custom"
+        job['custom_width'] = width
+        job['custom_height'] = height
+    else:
+        job['size_preset'] = "Same as background"
+    return job
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    job = job_from_args(args)
+
+    for background in args.bg:
+        if not os.path.isfile(background):
+            print(f"snapback: background not found: {background}", file=sys.stderr)
+            return 2
+
+    missing = [p for p in job['input_files'] or [job['input_path']] if not os.path.exists(p)]
+    if missing:
+        print(f"snapback: input not found: {missing[0]}", file=sys.stderr)
+        return 2
+
+    if args.watch:
+        return watch(job, args.quiet)
+
+    try:
+        input_files = get_input_files(job)
+    except (OSError, ValueError) as e:
+        print(f"snapback: {e}", file=sys.stderr)
+        return 2
+    if not input_files:
+        print("snapback: no valid input images found.", file=sys.stderr)
+        return 2
+
+    try:
+        summary = run_batch(job, input_files, safe_workers(job['worker_count']))
+    except Exception as e:
+        print(f"snapback: {e}", file=sys.stderr)
+        return 1
+
+    for file_path, message in summary['failed']:
+        print(f"Error processing {file_path}: {message}", file=sys.stderr)
+    if not args.quiet:
+        print(f"Processed {summary['processed']}/{summary['total']} image(s) in "
+              f"{summary['elapsed']:.2f}s ({summary['images_per_sec']:.1f} img/s, "
+              f"{summary['workers']} worker(s)).")
+        if summary['resumed']:
+            print(f"Resumed: {summary['resumed']} image(s) were done by the interrupted run.")
+        if summary['skipped']:
+            print(f"Skipped {summary['skipped']} up-to-date image(s).")
+        if summary['duplicates']:
+            print(f"Linked {summary['duplicates']} duplicate image(s), saving "
+                  f"~{summary['dedup_saved_seconds']:.1f}s of compositing.")
+        print(f"Report: {summary['report_path']}")
+    return 1 if summary['failed'] else 0
+
+def watch(job, quiet):
+    """
+    Run watch mode until interrupted with Ctrl+C.
+    """
+    if job['input_type'] != "Folder":
+        print("snapback: --watch needs an input folder.", file=sys.stderr)
+        return 2
+
+    def on_batch(summary):
+        if not quiet:
+            print(f"Composited {summary['processed']} new image(s).", flush=True)
+
+    def on_error(file_path, message):
+        print(f"Error processing {file_path}: {message}", file=sys.stderr, flush=True)
+
+    if not quiet:
+        print(f"Watching {job['input_path']} (Ctrl+C to stop)...", flush=True)
+    try:
+        watch_folder(job, on_batch=on_batch, on_error=on_error)
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        print(f"snapback: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
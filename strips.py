@@ -0,0 +1,158 @@
+"""
+strips.py
+
+Low-memory compositing for very large canvases, such as 16K or
+multi-monitor spanning wallpapers. Instead of a full-size canvas, a
+StripCanvas keeps the decoded background at its own size and writes the
+output PNG in horizontal strips of STRIP_HEIGHT rows:
+
+- strips the overlay does not cover are resized from the background and
+  compressed once, then reused as compressed bytes for every output;
+- only the strips the overlay covers are resized and composited per image.
+
+Each strip is compressed on its own and ends with a sync flush, so the
+segments can be concatenated into the single zlib stream PNG needs, and
+no full-size canvas (or a filtered copy of one) ever exists. Rows use the
+PNG "Up" filter, and the first row of each strip "Sub", so a strip never
+depends on the pixels of the strip above it.
+"""
+
+import struct
+import zlib
+from PIL import Image, ImageChops
+from report import stage
+from helpers import open_background
+
+STRIP_HEIGHT = 256
+# Canvases from this size up are composited in strips (strip mode "Auto").
+LARGE_CANVAS_PIXELS = 40_000_000
+DEFAULT_COMPRESS_LEVEL = 6  # zlib's default, as used by Pillow's PNG encoder.
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+ZLIB_HEADER = b"\x78\x9c"
+FINAL_BLOCK = b"\x03\x00"  # An empty final deflate block.
+COLOR_TYPES = {"RGB": 2, "RGBA": 6}
+FILTER_SUB = b"\x01"
+FILTER_UP = b"\x02"
+_ADLER_BASE = 65521
+
+def png_chunk(kind, data):
+    return (struct.pack(">I", len(data)) + kind + data
+            + struct.pack(">I", zlib.crc32(data, zlib.crc32(kind))))
+
+def adler32_combine(adler1, adler2, length2):
+    """
+    The Adler-32 of two byte strings joined, from their checksums and the
+    length of the second.
+    """
+    sum1 = ((adler1 & 0xffff) + (adler2 & 0xffff) - 1) % _ADLER_BASE
+    sum2 = ((adler1 >> 16) + (adler2 >> 16) + length2 * ((adler1 & 0xffff) - 1)) % _ADLER_BASE
+    return sum1 | (sum2 << 16)
+
+def filter_rows(strip):
+    """
+    The PNG scanlines of strip: each row prefixed with its filter type and
+    stored as the difference to the row above ("Up"); the first row as the
+    difference to the pixel on its left ("Sub").
+    """
+    width, height = strip.size
+    above = Image.new(strip.mode, strip.size)
+    if height > 1:
+        above.paste(strip.crop((0, 0, width, height - 1)), (0, 1))
+    filtered = ImageChops.subtract_modulo(strip, above)
+    first = strip.crop((0, 0, width, 1))
+    left = Image.new(strip.mode, first.size)
+    if width > 1:
+        left.paste(first.crop((0, 0, width - 1, 1)), (1, 0))
+    filtered.paste(ImageChops.subtract_modulo(first, left), (0, 0))
+
+    raw = memoryview(filtered.tobytes())
+    stride = width * len(strip.getbands())
+    rows = [FILTER_SUB, raw[:stride]]
+    for y in range(1, height):
+        rows += [FILTER_UP, raw[y * stride:(y + 1) * stride]]
+    return b"".join(rows)
+
+def compress_strip(strip, compress_level=DEFAULT_COMPRESS_LEVEL):
+    """
+    (IDAT chunk, Adler-32, uncompressed length) for one strip.
+    """
+    data = filter_rows(strip)
+    compressor = zlib.compressobj(compress_level, zlib.DEFLATED, -15)
+    segment = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    return png_chunk(b"IDAT", segment), zlib.adler32(data), len(data)
+
+class StripCanvas:
+    """
+    Stand-in for a full-size canvas (see engine.prepare_canvas) that
+    renders outputs strip by strip. Only PNG output is supported.
+    """
+
+    def __init__(self, source, size, mode, compress_level=DEFAULT_COMPRESS_LEVEL):
+        """
+        :param source: The decoded background, at its own size.
+        :param size: Output (canvas) size.
+        :param mode: Output mode, "RGB" or "RGBA".
+        :param compress_level: zlib level, 0-9 (see encoding.py).
+        """
+        self.source = source
+        self.size = tuple(size)
+        self.width, self.height = self.size
+        self.mode = mode
+        self.compress_level = compress_level
+        self._strips = {}  # strip top -> compress_strip() of the background
+
+    @classmethod
+    def open(cls, path, size, mode, compress_level=DEFAULT_COMPRESS_LEVEL):
+        source = open_background(path)
+        source.load()
+        if source.mode not in ("RGB", "RGBA"):
+            source = source.convert(mode)
+        return cls(source, size, mode, compress_level)
+
+    def background_strip(self, top, bottom):
+        """
+        Rows top to bottom of the background, resized to the canvas width
+        and converted to the canvas mode.
+        """
+        if self.source.size == self.size:
+            strip = self.source.crop((0, top, self.width, bottom))
+        else:
+            ratio = self.source.height / self.height
+            strip = self.source.resize((self.width, bottom - top),
+                                       box=(0, top * ratio, self.source.width, bottom * ratio))
+        return strip if strip.mode == self.mode else strip.convert(self.mode)
+
+    def encode(self, overlay, position, timings=None):
+        """
+        The PNG file for overlay pasted onto the background at position.
+        Strip compositing is added to timings['composite'], filtering and
+        compression to timings['encode'].
+        """
+        x, y = position
+        covered = x < self.width and x + overlay.width > 0
+        mask = overlay if overlay.mode == "RGBA" else None
+        header = struct.pack(">IIBBBBB", self.width, self.height, 8, COLOR_TYPES[self.mode], 0, 0, 0)
+        parts = [PNG_SIGNATURE, png_chunk(b"IHDR", header), png_chunk(b"IDAT", ZLIB_HEADER)]
+        checksum = 1  # Adler-32 of no data.
+        for top in range(0, self.height, STRIP_HEIGHT):
+            bottom = min(top + STRIP_HEIGHT, self.height)
+            if covered and y < bottom and y + overlay.height > top:
+                with stage(timings, 'composite'):
+                    strip = self.background_strip(top, bottom)
+                    strip.paste(overlay, (x, y - top), mask)
+                with stage(timings, 'encode'):
+                    chunk, adler, length = compress_strip(strip, self.compress_level)
+            else:
+                cached = self._strips.get(top)
+                if cached is None:
+                    with stage(timings, 'composite'):
+                        strip = self.background_strip(top, bottom)
+                    with stage(timings, 'encode'):
+                        cached = self._strips[top] = compress_strip(strip, self.compress_level)
+                chunk, adler, length = cached
+            parts.append(chunk)
+            checksum = adler32_combine(checksum, adler, length)
+        parts.append(png_chunk(b"IDAT", FINAL_BLOCK + struct.pack(">I", checksum)))
+        parts.append(png_chunk(b"IEND", b""))
+        return b"".join(parts)
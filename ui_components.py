@@ -3,6 +3,8 @@ ui_components.py
 
 Builds the UI for SnapBack, storing user state in a dictionary of tkinter variables.
 We do NOT store input_path / input_type in config, so they reset each run.
+Only the first notebook tab is built up front; the others are built the first
+time they are selected, so the window appears sooner.
 """
 
 import tkinter as tk
@@ -15,14 +17,14 @@ def build_ui(root, user_config):
     :param user_config: The config loaded from config.py (which won't include input_path/input_type).
     :return: A dict of tkinter StringVars + references to certain widgets (for drag/drop).
     """
-    # Set default window dimensions to 420x380
-    root.geometry("420x380")
+    # Window size comes from the saved config (see main.py)
     # Main frame
     main_frame = ttk.Frame(root, padding=10)
     main_frame.grid(row=0, column=0, sticky='nsew')
     root.columnconfigure(0, weight=1)
     root.rowconfigure(0, weight=1)
     main_frame.columnconfigure(0, weight=1)
+    main_frame.columnconfigure(1, weight=1)
     main_frame.rowconfigure(1, weight=1)
 
     # Menubar
@@ -45,19 +47,36 @@ def build_ui(root, user_config):
         # Not saved in config:
         'input_type':    tk.StringVar(value="Folder"),
         'input_path':    tk.StringVar(value=""), 
+        'input_files':   [],  # Input set for input_type "Files" (see set_input_files)
         # Saved in config:
         'background_path':     tk.StringVar(value=user_config.get('background_path', "")),
+        'recursive':           tk.BooleanVar(value=user_config.get('recursive', False)),
+        'include_patterns':    tk.StringVar(value=user_config.get('include_patterns', "")),
+        'exclude_patterns':    tk.StringVar(value=user_config.get('exclude_patterns', "")),
+        'matrix_backgrounds':  tk.StringVar(value=user_config.get('matrix_backgrounds', "")),
+        'output_template':     tk.StringVar(value=user_config.get('output_template', "")),
         'custom_output_path':  tk.StringVar(value=user_config.get('custom_output_path', "")),
         'output_folder_option':tk.StringVar(value=user_config.get('output_folder_option', "Same as input")),
         'filename_postfix':    tk.StringVar(value=user_config.get('filename_postfix', "_composited")),
         'output_format':       tk.StringVar(value=user_config.get('output_format', "PNG")),
+        'renditions':          tk.StringVar(value=user_config.get('renditions', "")),
+        'encoding_profile':    tk.StringVar(value=user_config.get('encoding_profile', "Balanced")),
         'size_preset':         tk.StringVar(value=user_config.get('size_preset', "Same as background")),
         'custom_width':        tk.StringVar(value=user_config.get('custom_width', "")),
         'custom_height':       tk.StringVar(value=user_config.get('custom_height', "")),
         'position_option':     tk.StringVar(value=user_config.get('position_option', "Center")),
         'resize_scale':        tk.StringVar(value=user_config.get('resize_scale', "90")),
+        'resample_mode':       tk.StringVar(value=user_config.get('resample_mode', "Best")),
+        'strip_mode':          tk.StringVar(value=user_config.get('strip_mode', "Auto")),
+        'worker_count':        tk.StringVar(value=user_config.get('worker_count', "")),
+        'images_in_flight':    tk.StringVar(value=user_config.get('images_in_flight', "")),
+        'memory_limit_mb':     tk.StringVar(value=user_config.get('memory_limit_mb', "512")),
+        'incremental':         tk.BooleanVar(value=user_config.get('incremental', False)),
+        'deduplicate':         tk.BooleanVar(value=user_config.get('deduplicate', True)),
+        'resume':              tk.BooleanVar(value=False),  # Per run, never saved.
         'image_count':         tk.StringVar(value=''),  # for display in status bar
     }
+    state['input_type'].trace_add('write', lambda *args: _clear_input_set(state))
 
     # Tabs
     tab_bg_input = ttk.Frame(notebook, padding=10)
@@ -68,13 +87,27 @@ def build_ui(root, user_config):
     notebook.add(tab_output,   text="Output Settings")
     notebook.add(tab_advanced, text="Position & Sizing")
 
+    # The state variables above exist for every tab, so settings are loaded,
+    # saved and used by the engine whether or not a tab has been built yet.
     _build_tab_bg_input(tab_bg_input, state)
-    _build_tab_output(tab_output, state)
-    _build_tab_advanced(tab_advanced, state)
+    pending_tabs = {
+        str(tab_output): _build_tab_output,
+        str(tab_advanced): _build_tab_advanced,
+    }
+
+    def build_selected_tab(event):
+        tab = notebook.select()
+        builder = pending_tabs.pop(tab, None)
+        if builder:
+            builder(notebook.nametowidget(tab), state)
+
+    notebook.bind('<<NotebookTabChanged>>', build_selected_tab)
+
+    _build_live_preview(main_frame, state)
 
     # Status frame
     status_frame = ttk.Frame(main_frame)
-    status_frame.grid(row=1, column=0, sticky='ew', pady=(5, 0))
+    status_frame.grid(row=1, column=0, columnspan=2, sticky='ew', pady=(5, 0))
     status_frame.columnconfigure(1, weight=1)
 
     lbl_count = ttk.Label(status_frame, textvariable=state['image_count'], foreground="blue")
@@ -84,6 +117,18 @@ def build_ui(root, user_config):
 
     return state
 
+def _build_live_preview(parent, state):
+    """
+    Docked panel showing a live preview that follows the settings (see logic.enable_live_preview).
+    """
+    panel = ttk.LabelFrame(parent, text="Live Preview", padding=5)
+    panel.grid(row=0, column=1, sticky='nsew', padx=(10, 0))
+    panel.columnconfigure(0, weight=1)
+    panel.rowconfigure(0, weight=1)
+
+    state['live_preview_label'] = ttk.Label(panel, anchor='center', justify='center')
+    state['live_preview_label'].grid(row=0, column=0, sticky='nsew')
+
 def _build_menus(menubar, root):
     filemenu = tk.Menu(menubar, tearoff=False)
     filemenu.add_command(label="Exit", command=root.destroy)
@@ -122,6 +167,15 @@ def _build_tab_bg_input(frame, state):
         row=row, column=2, padx=5, pady=2
     )
 
+    row += 1
+    ttk.Label(frame, text="More Backgrounds:").grid(row=row, column=0, sticky='w', padx=5, pady=2)
+    ttk.Entry(frame, textvariable=state['matrix_backgrounds'], width=50).grid(
+        row=row, column=1, sticky='ew', padx=5, pady=2
+    )
+    ttk.Button(frame, text="Add", command=lambda: _add_matrix_backgrounds(state)).grid(
+        row=row, column=2, padx=5, pady=2
+    )
+
     row += 1
     lbl_input = ttk.Label(frame, text="📁 Input Images", style="Header.TLabel")
     lbl_input.grid(row=row, column=0, columnspan=3, sticky='w', pady=(8, 0))
@@ -141,6 +195,20 @@ def _build_tab_bg_input(frame, state):
         row=row, column=2, padx=5, pady=2
     )
 
+    row += 1
+    ttk.Checkbutton(frame, text="Include subfolders", variable=state['recursive']).grid(
+        row=row, column=1, sticky='w', padx=5, pady=2
+    )
+
+    row += 1
+    ttk.Label(frame, text="Include:").grid(row=row, column=0, sticky='w', padx=5, pady=2)
+    ttk.Entry(frame, textvariable=state['include_patterns']).grid(row=row, column=1, sticky='ew', padx=5, pady=2)
+    ttk.Label(frame, text="e.g. *.png; shots/*").grid(row=row, column=2, sticky='w', padx=5, pady=2)
+
+    row += 1
+    ttk.Label(frame, text="Exclude:").grid(row=row, column=0, sticky='w', padx=5, pady=2)
+    ttk.Entry(frame, textvariable=state['exclude_patterns']).grid(row=row, column=1, sticky='ew', padx=5, pady=2)
+
     row += 1
     btn_frame = ttk.Frame(frame)
     btn_frame.grid(row=row, column=0, columnspan=3, pady=(12, 0), sticky='ew')
@@ -151,6 +219,12 @@ def _build_tab_bg_input(frame, state):
     state['process_button'] = ttk.Button(btn_frame, text="✅ Process Images")
     state['process_button'].pack(side='left')
 
+    state['cancel_button'] = ttk.Button(btn_frame, text="⛔ Cancel", state='disabled')
+    state['cancel_button'].pack(side='left', padx=10)
+
+    state['watch_button'] = ttk.Button(btn_frame, text="👁 Watch Folder")
+    state['watch_button'].pack(side='left')
+
 def _build_tab_output(frame, state):
     frame.columnconfigure(1, weight=1)
 
@@ -182,6 +256,13 @@ def _build_tab_output(frame, state):
     ttk.Label(frame, text="Filename Postfix:").grid(row=row, column=0, sticky='w', padx=5, pady=2)
     ttk.Entry(frame, textvariable=state['filename_postfix']).grid(row=row, column=1, sticky='w', padx=5, pady=2)
 
+    row += 1
+    ttk.Label(frame, text="Name Template:").grid(row=row, column=0, sticky='w', padx=5, pady=2)
+    template_frame = ttk.Frame(frame)
+    template_frame.grid(row=row, column=1, sticky='w')
+    ttk.Entry(template_frame, textvariable=state['output_template']).pack(side='left', padx=(5, 2))
+    ttk.Label(template_frame, text="{name} {background} {postfix}").pack(side='left', padx=2)
+
     row += 1
     ttk.Label(frame, text="Image Format:").grid(row=row, column=0, sticky='w', padx=5, pady=2)
     om_format = ttk.OptionMenu(
@@ -194,6 +275,67 @@ def _build_tab_output(frame, state):
     )
     om_format.grid(row=row, column=1, sticky='w', padx=5, pady=2)
 
+    row += 1
+    ttk.Label(frame, text="Encoding:").grid(row=row, column=0, sticky='w', padx=5, pady=2)
+    encoding_frame = ttk.Frame(frame)
+    encoding_frame.grid(row=row, column=1, sticky='w')
+    ttk.OptionMenu(
+        encoding_frame,
+        state['encoding_profile'],
+        state['encoding_profile'].get(),
+        "Fast",
+        "Balanced",
+        "Smallest",
+        "Quality"
+    ).pack(side='left', padx=(5, 2))
+    ttk.Label(encoding_frame, text="(Fast = quickest saves, Smallest = smallest files)").pack(side='left', padx=2)
+
+    row += 1
+    ttk.Label(frame, text="Renditions:").grid(row=row, column=0, sticky='w', padx=5, pady=2)
+    renditions_frame = ttk.Frame(frame)
+    renditions_frame.grid(row=row, column=1, columnspan=2, sticky='w')
+    ttk.Entry(renditions_frame, textvariable=state['renditions'], width=40).pack(side='left', padx=(5, 2))
+    ttk.Label(renditions_frame, text="e.g. JPG q85 _email; WEBP 480x270 _thumb").pack(side='left', padx=2)
+
+    row += 1
+    ttk.Label(frame, text="Worker Processes:").grid(row=row, column=0, sticky='w', padx=5, pady=2)
+    workers_frame = ttk.Frame(frame)
+    workers_frame.grid(row=row, column=1, sticky='w')
+    tk.Entry(workers_frame, textvariable=state['worker_count'], width=7).pack(side='left', padx=(5, 2))
+    ttk.Label(workers_frame, text="(blank = all cores)").pack(side='left', padx=2)
+
+    row += 1
+    ttk.Label(frame, text="Images in Flight:").grid(row=row, column=0, sticky='w', padx=5, pady=2)
+    in_flight_frame = ttk.Frame(frame)
+    in_flight_frame.grid(row=row, column=1, sticky='w')
+    tk.Entry(in_flight_frame, textvariable=state['images_in_flight'], width=7).pack(side='left', padx=(5, 2))
+    ttk.Label(in_flight_frame, text="(blank = 2 per worker)").pack(side='left', padx=2)
+
+    row += 1
+    ttk.Label(frame, text="Memory Limit (MB):").grid(row=row, column=0, sticky='w', padx=5, pady=2)
+    tk.Entry(frame, textvariable=state['memory_limit_mb'], width=7).grid(row=row, column=1, sticky='w', padx=5, pady=2)
+
+    row += 1
+    ttk.Checkbutton(
+        frame,
+        text="Skip outputs that are already up to date",
+        variable=state['incremental']
+    ).grid(row=row, column=1, sticky='w', padx=5, pady=2)
+
+    row += 1
+    ttk.Checkbutton(
+        frame,
+        text="Composite identical images once (link the copies)",
+        variable=state['deduplicate']
+    ).grid(row=row, column=1, sticky='w', padx=5, pady=2)
+
+    row += 1
+    ttk.Checkbutton(
+        frame,
+        text="Resume interrupted run",
+        variable=state['resume']
+    ).grid(row=row, column=1, sticky='w', padx=5, pady=2)
+
 def _build_tab_advanced(frame, state):
     frame.columnconfigure(1, weight=1)
 
@@ -222,10 +364,36 @@ def _build_tab_advanced(frame, state):
     ttk.Label(size_frame, text="×").pack(side='left', padx=2)
     tk.Entry(size_frame, textvariable=state['custom_height'], width=7).pack(side='left')
 
+    row += 1
+    ttk.Label(frame, text="Low-Memory Strips:").grid(row=row, column=0, sticky='w', padx=5, pady=2)
+    strips_frame = ttk.Frame(frame)
+    strips_frame.grid(row=row, column=1, sticky='w')
+    ttk.OptionMenu(
+        strips_frame,
+        state['strip_mode'],
+        state['strip_mode'].get(),
+        "Auto",
+        "Always",
+        "Off"
+    ).pack(side='left', padx=(5, 2))
+    ttk.Label(strips_frame, text="(PNG output; Auto = canvases over 40 MP)").pack(side='left', padx=2)
+
     row += 1
     ttk.Label(frame, text="Resize Overlay (%):").grid(row=row, column=0, sticky='w', padx=5, pady=2)
     tk.Entry(frame, textvariable=state['resize_scale'], width=10).grid(row=row, column=1, sticky='w', padx=5, pady=2)
 
+    row += 1
+    ttk.Label(frame, text="Resampling:").grid(row=row, column=0, sticky='w', padx=5, pady=2)
+    om_resample = ttk.OptionMenu(
+        frame,
+        state['resample_mode'],
+        state['resample_mode'].get(),
+        "Fast",
+        "Balanced",
+        "Best"
+    )
+    om_resample.grid(row=row, column=1, sticky='w', padx=5, pady=2)
+
     row += 1
     lbl_pos = ttk.Label(frame, text="📍 Position on Background", style="Header.TLabel")
     lbl_pos.grid(row=row, column=0, columnspan=3, sticky='w', pady=(10, 0))
@@ -249,13 +417,47 @@ def _select_background(state):
     if path:
         state['background_path'].set(path)
 
+def _add_matrix_backgrounds(state):
+    """
+    Add backgrounds for a matrix batch: every input is composited onto the
+    main background and each of these.
+    """
+    paths = filedialog.askopenfilenames(filetypes=[("Image files", "*.png *.jpg *.jpeg *.webp")])
+    if paths:
+        current = [p.strip() for p in state['matrix_backgrounds'].get().split(";") if p.strip()]
+        state['matrix_backgrounds'].set("; ".join(current + list(paths)))
+
 def _select_input(state):
     if state['input_type'].get() == "Folder":
         path = filedialog.askdirectory()
-    else:
-        path = filedialog.askopenfilename(filetypes=[("Image files", "*.png *.jpg *.jpeg *.webp")])
-    if path:
-        state['input_path'].set(path)
+        if path:
+            state['input_path'].set(path)
+        return
+    paths = filedialog.askopenfilenames(filetypes=[("Image files", "*.png *.jpg *.jpeg *.webp"),
+                                                   ("ZIP archives", "*.zip")])
+    if len(paths) > 1:
+        set_input_files(state, paths)
+    elif paths:
+        state['input_type'].set("File")
+        state['input_path'].set(paths[0])
+
+def set_input_files(state, paths):
+    """
+    Use an explicit list of images as the input. The files are processed
+    where they are; nothing is copied.
+    """
+    from engine import input_set
+
+    fields = input_set(paths)
+    state['input_type'].set(fields['input_type'])
+    state['input_files'] = fields['input_files']
+    state['input_path'].set(fields['input_path'])
+    state['image_count'].set(f"{len(paths)} image(s) selected.")
+
+def _clear_input_set(state):
+    # Choosing "Folder" or "File" again drops the input set.
+    if state['input_type'].get() != "Files":
+        state['input_files'] = []
 
 def _select_output_folder(state):
     path = filedialog.askdirectory()
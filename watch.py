@@ -0,0 +1,112 @@
+"""
+watch.py
+
+Hot-folder watch mode for SnapBack. Polls the input folder (and, with
+recursive discovery, its subfolders) and composites
+images as they arrive or change, without rescanning and redoing the whole
+folder. Files are only picked up once their size and modification time have
+stopped changing, so images that are still being written are left alone.
+The background is prepared once and reused from the shared cache.
+"""
+
+import os
+import time
+import threading
+from helpers import get_output_folder
+from discovery import iter_image_entries
+from engine import discovery_options, prepare_background, run_batch
+
+POLL_INTERVAL = 1.0   # Seconds between folder scans.
+SETTLE_TIME = 2.0     # Seconds a file must stay unchanged before it is composited.
+
+def scan_folder(folder, **options):
+    """
+    Return {path: (mtime_ns, size)} for the images in folder (see
+    discovery.iter_image_entries for options).
+    """
+    found = {}
+    for entry in iter_image_entries(folder, **options):
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue  # Deleted or locked between listing and stat.
+        found[entry.path] = (stat.st_mtime_ns, stat.st_size)
+    return found
+
+def _is_own_output(job, path, out_folder):
+    """
+    True for files SnapBack itself wrote into the watched folder, so outputs
+    are never fed back in as inputs.
+    """
+    out_folder = os.path.abspath(out_folder)
+    if os.path.commonpath([os.path.abspath(path), out_folder]) != out_folder:
+        return False
+    postfix = job['filename_postfix'].strip() or "_composited"
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return stem.endswith(postfix)
+
+def watch_folder(job, on_batch=None, on_error=None, stop_event=None,
+                 process_existing=False, poll_interval=POLL_INTERVAL, settle_time=SETTLE_TIME):
+    """
+    Watch job['input_path'] until stop_event is set, compositing new or
+    changed images in the calling thread.
+
+    :param job: Plain job dictionary (see engine.JOB_KEYS); input_path must be a folder.
+    :param on_batch: Optional callback(summary) after each group of new files.
+    :param on_error: Optional callback(file_path, message) for each failed file.
+    :param stop_event: threading.Event that ends the watch. A private one is used if omitted.
+    :param process_existing: Also composite the images already in the folder at start.
+    """
+    # Watch batches keep no journal, so there is no run of theirs to resume;
+    # an interrupted batch's journal in the output folder must not apply.
+    job = dict(job, resume=False)
+    folder = job['input_path']
+    if not os.path.isdir(folder):
+        raise NotADirectoryError(f"Not a folder: {folder}")
+    if stop_event is None:
+        stop_event = threading.Event()
+
+    out_folder = get_output_folder(job)
+    options = discovery_options(job)
+    # Decode and resize the background up front; later batches hit the cache.
+    prepare_background(job)
+
+    # path -> (mtime_ns, size) the file had when it was last composited.
+    done = {} if process_existing else scan_folder(folder, **options)
+    # path -> ((mtime_ns, size), monotonic time that identity was first seen).
+    pending = {}
+    # Outputs written by this watch, whatever name template produced them.
+    written = set()
+
+    while not stop_event.is_set():
+        now = time.monotonic()
+        current = scan_folder(folder, **options)
+        ready = []
+        for path, identity in current.items():
+            if (done.get(path) == identity or os.path.abspath(path) in written
+                    or _is_own_output(job, path, out_folder)):
+                pending.pop(path, None)
+                continue
+            seen = pending.get(path)
+            if seen is None or seen[0] != identity:
+                pending[path] = (identity, now)
+            elif now - seen[1] >= settle_time:
+                ready.append(path)
+        for path in list(pending):
+            if path not in current:
+                del pending[path]
+
+        if ready:
+            ready.sort()
+            summary = run_batch(job, ready, workers=1, on_error=on_error, cancel_event=stop_event,
+                                report=False, journal=False)
+            for file_record in summary['files']:
+                written.update(os.path.abspath(p) for p in file_record['output'].split("; ") if p)
+            for path in ready:
+                # Failed files are marked done too; they are retried once they change.
+                pending.pop(path, None)
+                done[path] = current[path]
+            if on_batch:
+                on_batch(summary)
+
+        stop_event.wait(poll_interval)